@@ -1,9 +1,12 @@
 import os
 import csv
 import re
+import json
+import base64
 import locale
 import hashlib
 import uuid
+import traceback
 import yaml
 from datetime import datetime
 from urllib.parse import quote, unquote
@@ -67,7 +70,6 @@ def load_users():
                         if len(keys) >= 2:
                             users[row[keys[0]]] = row[keys[1]]
         except Exception as e:
-            import traceback
             print(f"ERROR: ユーザーファイル読み込みエラー: {e}")
             print(f"ERROR: トレースバック:\n{traceback.format_exc()}")
     return users
@@ -468,12 +470,10 @@ def pdf_to_images(filename, username=None, student_name=None, student_number=Non
                         )
                         
                     except Exception as e:
-                        import traceback
                         print(f"ERROR: QRコード生成エラー: {e}")
                         print(f"ERROR: トレースバック:\n{traceback.format_exc()}")
                     
             except Exception as e:
-                import traceback
                 print(f"ERROR: テキスト描画エラー: {e}")
                 print(f"ERROR: トレースバック:\n{traceback.format_exc()}")
         
@@ -636,9 +636,15 @@ def save_print_id_mapping(print_id: str, filename: str):
     if file_exists:
         try:
             with open(PRINT_ID_MAPPING_FILE, "r", encoding="utf-8", newline="") as f:
-                reader = csv.DictReader(f)
+                # 2列だけを使うため、行ごとにdictを作るDictReaderではなくcsv.readerで読む
+                reader = csv.reader(f)
+                header = next(reader, [])
+                id_index = header.index("print_id")
+                filename_index = header.index("filename")
+                min_len = max(id_index, filename_index) + 1
                 for row in reader:
-                    existing_mappings[row["print_id"]] = row["filename"]
+                    if len(row) >= min_len:
+                        existing_mappings[row[id_index]] = row[filename_index]
         except Exception as e:
             print(f"マッピングファイル読み込みエラー: {e}")
     
@@ -1132,7 +1138,6 @@ def header(filename):
         # HTMLテンプレートで表示（画像サイズを渡す）
         return render_template("header.html", image_url=image_url, img_width=img_width, img_height=img_height)
     except Exception as e:
-        import traceback
         print(f"ERROR: 頭紙生成エラー: {e}")
         print(f"ERROR: トレースバック:\n{traceback.format_exc()}")
         return f"頭紙生成エラー: {e}", 500
@@ -1151,7 +1156,6 @@ def headers_batch():
             # JSONが送信されていない場合、フォームデータから取得を試みる
             data = request.form.to_dict()
             if "files" in data:
-                import json
                 data["files"] = json.loads(data["files"])
         
         if data is None:
@@ -1163,7 +1167,6 @@ def headers_batch():
         if not file_paths or not selected_campus_name:
             return jsonify({"error": "ファイルと校舎を選択してください"}), 400
     except Exception as e:
-        import traceback
         print(f"ERROR: リクエスト解析エラー: {e}")
         print(f"ERROR: トレースバック:\n{traceback.format_exc()}")
         return jsonify({"error": f"リクエスト解析エラー: {str(e)}"}), 400
@@ -1219,11 +1222,8 @@ def headers_batch():
         
         # 一括印刷用のURLを生成（クエリパラメータで画像URLを渡す）
         # または、セッションに保存してからリダイレクト
-        import base64
-        import json as json_module
-        
         # 画像URLをJSONエンコードしてbase64エンコード
-        image_urls_json = json_module.dumps(image_urls)
+        image_urls_json = json.dumps(image_urls)
         image_urls_encoded = base64.urlsafe_b64encode(image_urls_json.encode('utf-8')).decode('utf-8')
         
         # 一括印刷ページのURLを返す
@@ -1231,7 +1231,6 @@ def headers_batch():
         
         return jsonify({"url": batch_url})
     except Exception as e:
-        import traceback
         print(f"ERROR: 頭紙一括生成エラー: {e}")
         print(f"ERROR: トレースバック:\n{traceback.format_exc()}")
         return f"頭紙一括生成エラー: {e}", 500
@@ -1241,9 +1240,6 @@ def headers_batch():
 @login_required
 def headers_batch_view():
     """一括印刷用の頭紙を表示"""
-    import base64
-    import json as json_module
-    
     # クエリパラメータから画像URLを取得
     images_encoded = request.args.get("images", "")
     if not images_encoded:
@@ -1252,7 +1248,7 @@ def headers_batch_view():
     try:
         # base64デコードしてJSONを取得
         image_urls_json = base64.urlsafe_b64decode(images_encoded.encode('utf-8')).decode('utf-8')
-        image_urls = json_module.loads(image_urls_json)
+        image_urls = json.loads(image_urls_json)
         
         # 画像サイズを取得（オプション）
         img_width = request.args.get("width", type=int)
@@ -1260,7 +1256,6 @@ def headers_batch_view():
         
         return render_template("header_batch.html", image_urls=image_urls, img_width=img_width, img_height=img_height)
     except Exception as e:
-        import traceback
         print(f"ERROR: 頭紙一括表示エラー: {e}")
         print(f"ERROR: トレースバック:\n{traceback.format_exc()}")
         return f"頭紙一括表示エラー: {e}", 500
@@ -1427,7 +1422,6 @@ def favicon():
 @app.errorhandler(500)
 def internal_error(error):
     """内部サーバーエラーのハンドラー"""
-    import traceback
     error_msg = str(error)
     traceback_str = traceback.format_exc()
     print(f"ERROR: 内部サーバーエラー: {error_msg}")
@@ -1438,7 +1432,6 @@ def internal_error(error):
 @app.errorhandler(Exception)
 def handle_exception(e):
     """すべての例外をキャッチするハンドラー"""
-    import traceback
     error_msg = str(e)
     traceback_str = traceback.format_exc()
     print(f"ERROR: 予期しないエラー: {error_msg}")
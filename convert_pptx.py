@@ -10,6 +10,7 @@ import re
 import sys
 import shutil
 import io
+import traceback
 from copy import deepcopy
 from pptx import Presentation
 from pptx.util import Inches, Pt
@@ -18,6 +19,9 @@ from pptx.dml.color import RGBColor
 from pptx.oxml import parse_xml
 from pptx.oxml.ns import nsdecls, qn
 
+# 解答が見つからない場合の番兵（dict.getのデフォルト値として使用）
+_MISSING = object()
+
 
 def extract_answers(answer_slide):
     """
@@ -348,7 +352,35 @@ def match_question_numbers(question_slides, prs, answer_numbers):
     return slide_question_numbers
 
 
-def duplicate_slide_complete(prs, source_slide):
+def duplicate_slides_complete(prs, source_slides):
+    """
+    複数のスライドをまとめて完全複製する
+    スライドIDの採番（既存IDの走査）は最初の1回だけ行い、以降はローカルに加算する
+    レイアウトのプレースホルダーは複製直後に削除するため、最初から生成しない
+    
+    Args:
+        prs: Presentationオブジェクト
+        source_slides: 複製元のスライドのリスト
+        
+    Returns:
+        複製されたスライドオブジェクトのリスト（source_slidesと同じ順序）
+    """
+    sldIdLst = prs.slides._sldIdLst
+    used_ids = [int(sldId.get('id')) for sldId in sldIdLst if sldId.get('id', '').isdigit()]
+    next_id = max(used_ids) + 1 if used_ids else 256
+    
+    dest_slides = []
+    for source_slide in source_slides:
+        # 空のスライドを作成し、スライドIDを直接付与する
+        rId, dest_slide = prs.part.add_slide(source_slide.slide_layout)
+        sldIdLst._add_sldId(id=next_id, rId=rId)
+        next_id += 1
+        dest_slides.append(duplicate_slide_complete(prs, source_slide, dest_slide=dest_slide))
+    
+    return dest_slides
+
+
+def duplicate_slide_complete(prs, source_slide, dest_slide=None):
     """
     スライドを完全複製する（画像やコメントも保持）
     Ctrl+C/Ctrl+Vのようにスライド全体を完全にコピー
@@ -357,14 +389,14 @@ def duplicate_slide_complete(prs, source_slide):
     Args:
         prs: Presentationオブジェクト
         source_slide: 複製元のスライド
+        dest_slide: 複製先のスライド（Noneの場合は新規作成）
         
     Returns:
         複製されたスライドオブジェクト
     """
-    import io
-    
     # 新しいスライドを作成（同じレイアウトを使用）
-    dest_slide = prs.slides.add_slide(source_slide.slide_layout)
+    if dest_slide is None:
+        dest_slide = prs.slides.add_slide(source_slide.slide_layout)
     
     # デフォルトのプレースホルダーを削除（新規作成時に自動で入るテキストボックスを削除）
     for shape in list(dest_slide.shapes):
@@ -529,7 +561,6 @@ def duplicate_slide_complete(prs, source_slide):
                                                     except Exception as e:
                                                         print(f"  デバッグ: 画像パート追加エラー (rId: {rId}): {e}")
                                                         print(f"  デバッグ: エラーの型: {type(e)}")
-                                                        import traceback
                                                         print(f"  デバッグ: トレースバック:\n{traceback.format_exc()}")
                                                         # エラーが発生しても処理を続行
                                                         continue
@@ -1311,35 +1342,27 @@ def convert_pptx(input_path, output_path=None):
     # 問題ページの後に挿入するため、前から処理
     new_question_slides_with_answers = []
     
-    for idx in range(len(question_slides)):  # 0から始まるインデックス
-        # 元のスライドのインデックスを取得（new_prs内での位置）
-        # 0: 表紙, 1～len(question_slides): 問題ページ, 最後: 解答ページ
-        source_slide_index = idx + 1  # 問題ページのインデックス（1から始まる）
-        
-        # 元のスライドを取得
-        source_slide = new_slides_list[source_slide_index]
-        
-        # 照合された大問番号を取得（左右両方）
-        left_num, right_num = slide_question_numbers[idx]
-        
-        # スライドを完全複製
-        new_slide = duplicate_slide_complete(new_prs, source_slide)
-        
-        # 左側の解答を追加
-        if left_num is not None:
-            answer_text = answers.get(left_num, "（未設定）")
-            if answer_text == "（未設定）":
-                print(f"警告: 大問{left_num}の解答が見つかりませんでした。")
-            else:
-                add_answer_textbox(new_slide, answer_text, new_prs, position='left')
-        
-        # 右側の解答を追加
-        if right_num is not None:
-            answer_text = answers.get(right_num, "（未設定）")
-            if answer_text == "（未設定）":
-                print(f"警告: 大問{right_num}の解答が見つかりませんでした。")
+    # 元のスライドを取得（new_prs内での位置）
+    # 0: 表紙, 1～len(question_slides): 問題ページ, 最後: 解答ページ
+    source_slides = new_slides_list[1:len(question_slides) + 1]
+    
+    # スライドをまとめて完全複製
+    new_slides = duplicate_slides_complete(new_prs, source_slides)
+    
+    # ループ内で参照する関数・辞書はローカル変数に束縛しておく
+    get_answer = answers.get
+    add_textbox = add_answer_textbox
+    
+    for new_slide, (left_num, right_num) in zip(new_slides, slide_question_numbers):
+        # 左側・右側の解答を追加
+        for q_num, position in ((left_num, 'left'), (right_num, 'right')):
+            if q_num is None:
+                continue
+            answer_text = get_answer(q_num, _MISSING)
+            if answer_text is _MISSING:
+                print(f"警告: 大問{q_num}の解答が見つかりませんでした。")
             else:
-                add_answer_textbox(new_slide, answer_text, new_prs, position='right')
+                add_textbox(new_slide, answer_text, new_prs, position=position)
         
         new_question_slides_with_answers.append(new_slide)
     
@@ -1396,7 +1419,6 @@ def main():
         convert_pptx(input_path, output_path)
     except Exception as e:
         print(f"エラー: {e}", file=sys.stderr)
-        import traceback
         traceback.print_exc()
         sys.exit(1)
 
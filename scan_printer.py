@@ -9,7 +9,10 @@ import re
 import csv
 import shutil
 import time
+import atexit
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Tuple, Union
@@ -19,8 +22,10 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
 try:
-    from pyzbar.pyzbar import decode as pyzbar_decode
+    from pyzbar.pyzbar import decode as pyzbar_decode, ZBarSymbol
     from PIL import Image
+    # QRコード以外のバーコード（CODE128・EANなど）の探索を省略する
+    QR_SYMBOLS = [ZBarSymbol.QRCODE]
     HAS_PYZBAR = True
 except ImportError:
     HAS_PYZBAR = False
@@ -59,11 +64,21 @@ LOG_CSV = Path("print_log.csv")
 
 # 処理中のファイルを追跡（二重処理防止）
 processing_files = set()
+processing_files_lock = threading.Lock()
 
 # ファイル安定化チェック設定
 STABLE_CHECK_INTERVAL_SEC = 0.5
 STABLE_CHECK_COUNT = 6  # 0.5秒×6回=3秒間サイズ変化なしで安定扱い
 
+# PDF処理用のワーカースレッド（イベント毎にスレッドを生成せず、同時処理数を制限する）
+PDF_WORKER_THREADS = 4
+pdf_executor = ThreadPoolExecutor(max_workers=PDF_WORKER_THREADS, thread_name_prefix="pdf_worker")
+
+# イベント検知直後にサイズが変わらないことを確認する間隔（書き込み済みのファイルは安定化待ちを省略する）
+FAST_STABLE_CHECK_SEC = 0.05
+# ファイル末尾で%%EOFを探すバイト数（書き込み途中のPDFを高速判定で通さないため）
+PDF_TAIL_CHECK_BYTES = 1024
+
 # PDF→画像変換設定
 POPPLER_PATH = os.environ.get("POPPLER_PATH", None)
 if POPPLER_PATH is None:
@@ -71,6 +86,9 @@ if POPPLER_PATH is None:
     if os.path.exists(default_poppler_path):
         POPPLER_PATH = default_poppler_path
 
+# QRコードのペイロード解析用（PRINT_ID=... / PRINTER=... を1回の走査で取得）
+QR_FIELD_PATTERN = re.compile(r'(PRINT_ID|PRINTER)=([^,\s]+)')
+
 
 # ==========================
 # ログ設定
@@ -126,6 +144,22 @@ def wait_until_file_stable(path: Path) -> bool:
     return False
 
 
+def is_write_complete(path: Path) -> bool:
+    """短い間隔でサイズが変わらず、末尾に%%EOFがあれば書き込み済みとみなす（安定化待ちの高速判定）"""
+    try:
+        size = path.stat().st_size
+        if size <= 0:
+            return False
+        time.sleep(FAST_STABLE_CHECK_SEC)
+        if path.stat().st_size != size:
+            return False
+        with open(path, "rb") as f:
+            f.seek(max(0, size - PDF_TAIL_CHECK_BYTES))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+
 def extract_print_id_from_qr(pdf_path: Path) -> Tuple[Optional[str], Optional[str]]:
     """PDFの1ページ目からQRコードを読み取り、PRINT_IDとプリンター名を抽出
     戻り値: (print_id, printer_name)"""
@@ -149,7 +183,7 @@ def extract_print_id_from_qr(pdf_path: Path) -> Tuple[Optional[str], Optional[st
         # QRコードを検出
         for image in images:
             # pyzbarでQRコードを検出（PIL Imageをそのまま使用）
-            qr_codes = pyzbar_decode(image)
+            qr_codes = pyzbar_decode(image, symbols=QR_SYMBOLS)
             
             if not qr_codes:
                 continue
@@ -166,17 +200,15 @@ def extract_print_id_from_qr(pdf_path: Path) -> Tuple[Optional[str], Optional[st
             print_id = None
             printer_name = None
             
-            # PRINT_ID=QS_... の形式からPRINT_IDを抽出
-            match = re.search(r'PRINT_ID=([^,\s]+)', qr_data)
-            if match:
-                print_id = match.group(1).strip()
-                logging.info(f"PRINT_ID抽出: {print_id}")
-            
-            # PRINTER=プリンター名 の形式からプリンター名を抽出
-            match = re.search(r'PRINTER=([^,\s]+)', qr_data)
-            if match:
-                printer_name = match.group(1).strip()
-                logging.info(f"PRINTER抽出: {printer_name}")
+            # PRINT_ID=QS_... と PRINTER=プリンター名 を1回の走査で抽出（最初の出現を採用）
+            for match in QR_FIELD_PATTERN.finditer(qr_data):
+                key, value = match.group(1), match.group(2).strip()
+                if key == "PRINT_ID" and print_id is None:
+                    print_id = value
+                    logging.info(f"PRINT_ID抽出: {print_id}")
+                elif key == "PRINTER" and printer_name is None:
+                    printer_name = value
+                    logging.info(f"PRINTER抽出: {printer_name}")
             
             return print_id, printer_name
         
@@ -219,22 +251,73 @@ def get_campus_from_folder_path(file_path: Path) -> Optional[str]:
     return None
 
 
-def print_pdf(pdf_path: Path, printer_name: str, copies: int = 1) -> bool:
-    """PDFをWindows印刷キューに送信"""
+def get_direct_pdf_printers(printer_config: dict) -> set:
+    """printers.yamlで direct_pdf: true が指定されたプリンタ名の集合を返す"""
+    return {
+        settings["printer_name"]
+        for settings in printer_config.values()
+        if settings.get("direct_pdf") and settings.get("printer_name")
+    }
+
+
+def raw_print_pdf(pdf_path: Path, printer_name: str) -> None:
+    """PDFのバイト列をRAWデータとしてスプーラに直接送信（PDFダイレクト印刷対応機用）"""
+    handle = win32print.OpenPrinter(printer_name)
+    try:
+        win32print.StartDocPrinter(handle, 1, (pdf_path.name, None, "RAW"))
+        try:
+            win32print.StartPagePrinter(handle)
+            with open(pdf_path, "rb") as f:
+                win32print.WritePrinter(handle, f.read())
+            win32print.EndPagePrinter(handle)
+        finally:
+            win32print.EndDocPrinter(handle)
+    finally:
+        win32print.ClosePrinter(handle)
+
+
+# 利用可能なプリンタ名のキャッシュ（EnumPrintersはスプーラへの問い合わせで遅いため）
+PRINTER_CACHE_TTL_SEC = 30
+_printer_cache = {"ts": None, "printers": frozenset()}
+
+
+def get_known_printers(refresh: bool = False) -> frozenset:
+    """ローカル＋ネットワークプリンタ名の集合を取得（TTL内はキャッシュを返す。refresh=Trueで再列挙）"""
+    now = time.monotonic()
+    if not refresh and _printer_cache["ts"] is not None and now - _printer_cache["ts"] < PRINTER_CACHE_TTL_SEC:
+        return _printer_cache["printers"]
+    
+    # 接続済みのネットワークプリンタはPRINTER_ENUM_CONNECTIONSで取得できる
+    # （PRINTER_ENUM_NETWORKはネットワーク全体を探索するため数秒かかることがある）
+    flags = win32print.PRINTER_ENUM_LOCAL | win32print.PRINTER_ENUM_CONNECTIONS
+    printers = [printer[2] for printer in win32print.EnumPrinters(flags)]
+    _printer_cache["printers"] = frozenset(printers)
+    _printer_cache["ts"] = now
+    return _printer_cache["printers"]
+
+
+def print_pdf(pdf_path: Path, printer_name: str, copies: int = 1, direct_pdf: bool = False) -> bool:
+    """PDFをWindows印刷キューに送信
+    direct_pdf=True の場合はPDFビューアを起動せずスプーラへRAW送信する"""
     if not HAS_WIN32PRINT:
         logging.error("win32printが利用できません")
         return False
     
     try:
-        # プリンタが存在するか確認
-        printers = [printer[2] for printer in win32print.EnumPrinters(win32print.PRINTER_ENUM_LOCAL)]
-        if printer_name not in printers:
-            # ネットワークプリンタも確認
-            printers_network = [printer[2] for printer in win32print.EnumPrinters(win32print.PRINTER_ENUM_NETWORK)]
-            if printer_name not in printers_network:
+        # プリンタが存在するか確認（キャッシュにない場合はプリンタが追加された可能性があるため1回だけ再列挙）
+        if printer_name not in get_known_printers():
+            if printer_name not in get_known_printers(refresh=True):
                 logging.error(f"プリンタが見つかりません: {printer_name}")
                 return False
         
+        if direct_pdf:
+            try:
+                raw_print_pdf(pdf_path, printer_name)
+                logging.info(f"印刷ジョブを投入しました（RAW送信）: {pdf_path} -> {printer_name} (部数: {copies})")
+                return True
+            except Exception as e:
+                logging.warning(f"RAW送信に失敗したためShellExecuteで印刷します: {printer_name}, {e}")
+        
         # PDFを印刷
         win32api.ShellExecute(
             0,
@@ -253,6 +336,27 @@ def print_pdf(pdf_path: Path, printer_name: str, copies: int = 1) -> bool:
         return False
 
 
+# CSVログはプロセス起動中ずっと開いたままにする（ジョブ毎のopen/closeを避ける）
+_log_lock = threading.Lock()
+_log_fh = None
+_log_writer = None
+
+
+def _open_log_csv():
+    """CSVログを追記モードで開く（空のファイルの場合のみヘッダーを書き込む）"""
+    global _log_fh, _log_writer
+    _log_fh = open(LOG_CSV, "a", newline="", encoding="utf-8")
+    _log_writer = csv.writer(_log_fh)
+    # ヘッダーの要否は開いたハンドルのサイズで1回だけ判定する
+    if os.fstat(_log_fh.fileno()).st_size == 0:
+        _log_writer.writerow([
+            "timestamp", "campus", "scan_file", "print_id",
+            "printer", "result", "error_message"
+        ])
+        _log_fh.flush()
+    atexit.register(_log_fh.close)
+
+
 def log_print_result(
     campus: str,
     scan_file: str,
@@ -264,31 +368,26 @@ def log_print_result(
     """印刷結果をCSVログに記録"""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    # ログファイルが存在しない場合はヘッダーを書き込む
-    file_exists = LOG_CSV.exists()
-    
-    with open(LOG_CSV, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow([
-                "timestamp", "campus", "scan_file", "print_id",
-                "printer", "result", "error_message"
-            ])
-        writer.writerow([
+    with _log_lock:
+        if _log_writer is None:
+            _open_log_csv()
+        _log_writer.writerow([
             timestamp, campus, scan_file, print_id or "",
             printer, result, error_message
         ])
+        _log_fh.flush()
 
 
 def handle_pdf(pdf_path: Path) -> None:
-    """PDF1つの処理：安定化待ち→QR読取→印刷→ログ記録"""
+    """PDF1つの処理：安定化待ち→QR読取→印刷→ログ記録
+    書き込み済みのファイル（is_write_complete）は安定化待ちを省略する"""
     # 既に処理中のファイルはスキップ（二重処理防止）
     file_key = str(pdf_path)
-    if file_key in processing_files:
-        logging.info(f"処理中のファイルをスキップ: {pdf_path}")
-        return
-    
-    processing_files.add(file_key)
+    with processing_files_lock:
+        if file_key in processing_files:
+            logging.info(f"処理中のファイルをスキップ: {pdf_path}")
+            return
+        processing_files.add(file_key)
     
     try:
         # ファイルがPDFか確認
@@ -297,8 +396,8 @@ def handle_pdf(pdf_path: Path) -> None:
         
         logging.info(f"PDF検出: {pdf_path}")
         
-        # ファイル安定化待ち
-        if not wait_until_file_stable(pdf_path):
+        # ファイル安定化待ち（書き込み済みならすぐに処理）
+        if not is_write_complete(pdf_path) and not wait_until_file_stable(pdf_path):
             logging.warning(f"ファイルが安定しませんでした: {pdf_path}")
             return
         
@@ -396,7 +495,8 @@ def handle_pdf(pdf_path: Path) -> None:
             logging.warning(f"印刷部数が最大値を超えています: {copies} > {max_copies}, {max_copies}に制限")
             copies = max_copies
         
-        print_success = print_pdf(print_pdf_path, printer_name, copies)
+        direct_pdf = printer_name in get_direct_pdf_printers(printer_config)
+        print_success = print_pdf(print_pdf_path, printer_name, copies, direct_pdf=direct_pdf)
         
         if print_success:
             # 成功時、doneフォルダへ
@@ -453,34 +553,34 @@ def handle_pdf(pdf_path: Path) -> None:
             pass
     finally:
         # 処理中リストから削除
-        processing_files.discard(file_key)
+        with processing_files_lock:
+            processing_files.discard(file_key)
 
 
 # ==========================
 # Watchdog ハンドラ
 # ==========================
 class PDFHandler(FileSystemEventHandler):
+    @staticmethod
+    def _is_target_pdf(src_path: str) -> bool:
+        """inフォルダ直下のPDFかを文字列のみで判定（Path生成前の安価な事前フィルタ）"""
+        if not src_path.lower().endswith(".pdf"):
+            return False
+        return os.path.basename(os.path.dirname(src_path)) == "in"
+
     def on_created(self, event):
-        if event.is_directory:
+        if event.is_directory or not self._is_target_pdf(event.src_path):
             return
-        path = Path(event.src_path)
-        if path.suffix.lower() == ".pdf":
-            # 処理は別スレッドで実行（非ブロッキング）
-            import threading
-            threading.Thread(target=self._handle_pdf_delayed, args=(path,), daemon=True).start()
+        self._submit_pdf(Path(event.src_path))
     
-    def _handle_pdf_delayed(self, path: Path):
-        """少し待ってから処理（ファイル作成完了を待つ）"""
-        time.sleep(0.3)
-        handle_pdf(path)
+    def _submit_pdf(self, path: Path):
+        """処理をワーカースレッドへ投入（書き込み完了の確認はhandle_pdf側で行う）"""
+        pdf_executor.submit(handle_pdf, path)
     
     def on_moved(self, event):
-        if event.is_directory:
+        if event.is_directory or not self._is_target_pdf(event.dest_path):
             return
-        path = Path(event.dest_path)
-        if path.suffix.lower() == ".pdf":
-            import threading
-            threading.Thread(target=self._handle_pdf_delayed, args=(path,), daemon=True).start()
+        self._submit_pdf(Path(event.dest_path))
 
 
 def monitor_campus_folders():
@@ -514,6 +614,7 @@ def monitor_campus_folders():
         observer.stop()
     
     observer.join()
+    pdf_executor.shutdown(wait=True)
 
 
 def main():
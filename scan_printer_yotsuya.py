@@ -3,11 +3,27 @@
 監視フォルダを監視し、スキャンされたPDFを自動印刷
 """
 
+import io
 import os
+import re
 import csv
+import errno
+import heapq
+import hashlib
+import queue
+import itertools
 import shutil
+import difflib
+import tempfile
+import functools
 import time
+import atexit
 import logging
+import logging.handlers
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
@@ -21,16 +37,41 @@ except ImportError:
     logging.warning("yaml not available. Install: pip install PyYAML")
 
 from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
 from watchdog.events import FileSystemEventHandler
 
 try:
-    from pyzbar.pyzbar import decode as pyzbar_decode
-    from PIL import Image
+    from pyzbar.pyzbar import decode as pyzbar_decode, ZBarSymbol
+    from PIL import Image, ImageWin
+    # QRコード以外のバーコード（CODE128・EANなど）の探索を省略する
+    QR_SYMBOLS = [ZBarSymbol.QRCODE]
     HAS_PYZBAR = True
 except ImportError:
     HAS_PYZBAR = False
     logging.warning("pyzbar not available. Install: pip install pyzbar pillow")
 
+try:
+    import fitz  # pymupdf
+    HAS_FITZ = True
+except ImportError:
+    HAS_FITZ = False
+    logging.warning("pymupdf not available. Install: pip install pymupdf")
+
+try:
+    import cv2
+    import numpy as np
+    HAS_CV2 = True
+except ImportError:
+    HAS_CV2 = False
+    logging.warning("opencv not available. Install: pip install opencv-python numpy")
+
+try:
+    from rapidfuzz import fuzz
+    HAS_RAPIDFUZZ = True
+except ImportError:
+    HAS_RAPIDFUZZ = False
+    logging.warning("rapidfuzz not available. Install: pip install rapidfuzz (difflibで類似度を計算します)")
+
 try:
     from pdf2image import convert_from_path
     HAS_PDF2IMAGE = True
@@ -43,6 +84,7 @@ try:
     import win32api
     import win32ui
     import win32con
+    import win32file
     HAS_WIN32PRINT = True
     # 用紙サイズの定数
     DMPAPER_A4 = 9  # A4用紙
@@ -94,26 +136,49 @@ PRINTERS_CONFIG = Path(r"C:\Users\doctor\printviewer\printers.yaml")
 PRINTER_NAME = "執務室"  # FF Apeos C7070 PS H2
 
 
+# プリンタ設定のキャッシュ（ファイルの更新時刻とサイズが変わった場合のみ再読み込み）
+_printer_config_cache = {"mtime": None, "size": None, "data": {}}
+
+
 def load_printer_config():
-    """プリンタ設定を読み込む"""
-    if not PRINTERS_CONFIG.exists():
+    """プリンタ設定を読み込む（変更がなければキャッシュを返す）"""
+    try:
+        stat = PRINTERS_CONFIG.stat()
+    except OSError:
+        _printer_config_cache.update(mtime=None, size=None, data={})
         return {}
     
     if not HAS_YAML:
         logging.warning("yamlモジュールが利用できないため、プリンタ設定ファイルを読み込めません")
         return {}
     
+    if _printer_config_cache["mtime"] == stat.st_mtime_ns and _printer_config_cache["size"] == stat.st_size:
+        return _printer_config_cache["data"]
+    
     try:
         with open(PRINTERS_CONFIG, "r", encoding="utf-8") as f:
-            config = yaml.safe_load(f)
-            return config or {}
+            config = yaml.safe_load(f) or {}
     except Exception as e:
         logging.warning(f"プリンタ設定ファイルの読み込みエラー: {e}")
         return {}
+    
+    _printer_config_cache["mtime"] = stat.st_mtime_ns
+    _printer_config_cache["size"] = stat.st_size
+    _printer_config_cache["data"] = config
+    return config
 
 
-def find_printer_by_name(qr_printer_name: str, available_printers: list) -> Optional[str]:
-    """QRコードのプリンター名から実際のWindowsプリンター名を検索"""
+def find_printer_by_name(qr_printer_name: str, available_printers) -> Optional[str]:
+    """QRコードのプリンター名から実際のWindowsプリンター名を検索
+    同じプリンター名・プリンタ一覧・設定ファイルの組み合わせは前回の結果を再利用する"""
+    load_printer_config()
+    config_stamp = (_printer_config_cache["mtime"], _printer_config_cache["size"])
+    return _resolve_printer_name(qr_printer_name, tuple(available_printers), config_stamp)
+
+
+@functools.lru_cache(maxsize=32)
+def _resolve_printer_name(qr_printer_name: str, available_printers: tuple, config_stamp: tuple) -> Optional[str]:
+    """find_printer_by_nameの本体（config_stampはキャッシュのキーとしてのみ使用）"""
     try:
         logging.debug(f"find_printer_by_name: QR='{qr_printer_name}', 利用可能プリンタ数={len(available_printers)}")
         
@@ -122,6 +187,14 @@ def find_printer_by_name(qr_printer_name: str, available_printers: list) -> Opti
             logging.info(f"完全一致で発見: '{qr_printer_name}'")
             return qr_printer_name
         
+        # 大文字小文字・前後の空白の違いを無視して一致を試行
+        normalized_name = qr_printer_name.lower().strip()
+        normalized_printers = {printer.lower().strip(): printer for printer in available_printers}
+        if normalized_name in normalized_printers:
+            printer = normalized_printers[normalized_name]
+            logging.info(f"プリンター名一致（大文字小文字を無視）: '{qr_printer_name}' -> '{printer}'")
+            return printer
+        
         # printers.yamlからマッピングを確認
         try:
             printer_config = load_printer_config()
@@ -139,19 +212,13 @@ def find_printer_by_name(qr_printer_name: str, available_printers: list) -> Opti
         except Exception as e:
             logging.debug(f"プリンター設定ファイル読み込みエラー（無視）: {e}")
         
-        # 部分一致で検索（QRコードの名前が含まれるプリンターを探す）
+        # 部分一致で検索（どちらかの名前がもう一方に含まれるプリンターを1回の走査で探す）
         logging.debug(f"部分一致で検索中...")
-        for printer in available_printers:
-            if qr_printer_name in printer or printer in qr_printer_name:
+        for normalized_printer, printer in normalized_printers.items():
+            if normalized_name in normalized_printer or normalized_printer in normalized_name:
                 logging.info(f"プリンター名部分一致: '{qr_printer_name}' -> '{printer}'")
                 return printer
         
-        # 逆方向の部分一致（実際のプリンター名にQRコードの名前が含まれる場合）
-        for printer in available_printers:
-            if qr_printer_name in printer:
-                logging.info(f"プリンター名部分一致（逆）: '{qr_printer_name}' -> '{printer}'")
-                return printer
-        
         logging.warning(f"プリンター名が見つかりませんでした: '{qr_printer_name}'")
         logging.debug(f"利用可能なプリンタ: {available_printers}")
         return None
@@ -166,55 +233,298 @@ if POPPLER_PATH is None:
     if os.path.exists(default_poppler_path):
         POPPLER_PATH = default_poppler_path
 
+# QRコード読み取り時のレンダリング解像度（先頭から順に試行）
+QR_RENDER_DPIS = (120, 200)
+
+# QRコード周辺を切り出してpyzbarに渡す際の余白（QRコードの幅・高さに対する割合）と最大辺の長さ
+QR_CROP_PADDING_RATIO = 1 / 8
+QR_CROP_MAX_SIDE = 400
+
+# QRコードの位置が検出できない場合に先に読み取るページ上部の割合
+QR_TOP_REGION_RATIO = 0.5
+
+# PDFに埋め込まれた画像から直接QRコードを探す際の最大画素数（これより大きい画像はページ全体のスキャン画像とみなしてスキップ）
+QR_EMBEDDED_IMAGE_MAX_PIXELS = 1500 * 1500
+
+# QRコードのペイロード解析用（PRINT_ID=... / PRINTER=... / FILE=... を1回の走査で取得）
+QR_FIELD_PATTERN = re.compile(r'(PRINT_ID|PRINTER)=([^,\s]+)|FILE=([^,]+)')
+
 # ファイル安定化チェック設定
 STABLE_CHECK_INTERVAL_SEC = 0.5
 STABLE_CHECK_COUNT = 6  # 0.5秒×6回=3秒間サイズ変化なしで安定扱い
+STABLE_CHECK_COUNT_MOVED = 2  # リネーム（移動）で置かれたファイルは書き込み済みなので短縮
+WRITE_EVENT_QUIET_SEC = 0.3  # watchdogの書き込みイベントがこの時間途絶えたら書き込み完了とみなす
+
+# PDFヘッダー（%PDF-）を探す先頭バイト数（仕様上、先頭1024バイト以内にあればよい）
+PDF_HEADER_SEARCH_BYTES = 1024
+
+
+def _norm_key(path) -> str:
+    """パスの表記揺れ（大文字小文字・区切り文字・相対パス）を吸収した辞書キーを返す
+    watchdogのイベントごとにevent.src_pathの表記が異なっても同じファイルとして扱う
+    （処理中に移動されることがあるため、ファイルシステムに問い合わせるresolve()は使わない）"""
+    return os.path.normcase(os.path.abspath(path))
 
-# 処理中のファイルを追跡（二重処理防止）
+
+# watchdogで最後に書き込みイベントを受け取った時刻（正規化パス -> time.monotonic()）
+last_write_events = {}
+# 書き込みイベントの到着を待機中のスレッドへ通知する
+_write_event_cond = threading.Condition()
+WRITE_CONFIRM_SEC = 0.05  # イベント途絶後にサイズが変わらないことを確認する間隔
+# 監視に使っているObserverのイベント到着間隔（PollingObserverの場合は走査間隔。main()で設定）
+# WRITE_EVENT_QUIET_SECより長い場合は、イベントの途絶を書き込み完了の根拠にしない
+_observer_event_interval = 0.0
+
+# ファイル末尾で%%EOFを探すバイト数（書き込み途中のPDFを安定扱いにしないため）
+PDF_TAIL_CHECK_BYTES = 1024
+
+# watchdogイベントのまとめ待ち時間（この間に同じパスのイベントが続いた場合は1回の処理にまとめる）
+EVENT_DEBOUNCE_SEC = 0.5
+
+# 処理待ちのタイマー（正規化パス -> (threading.Timer, 安定化チェック回数)）
+_pending_timers = {}
+_pending_timers_lock = threading.Lock()
+
+# 処理中のファイルを追跡（二重処理防止。正規化パスで管理）
 processing_files = set()
+processing_files_lock = threading.Lock()
+
+# 処理を投入した時刻（正規化パス -> time.monotonic()）。watchdogの作成・変更イベントの重複投入をまとめる
+DISPATCH_DEBOUNCE_SEC = 1.5
+DISPATCH_HISTORY_SEC = 60
+_dispatched = {}
+_dispatched_lock = threading.Lock()
+
+
+# 処理済み・エラーフォルダへ移動したファイル（(ファイル名, サイズ, 更新時刻) -> time.monotonic()）
+# 同じファイルが数秒以内に再投入された場合はまとめてスキップする
+# スキャンのファイル名は文書タイトルから付くため、同名でもサイズ・更新時刻が異なれば別のファイルとして扱う
+RECENTLY_DONE_SEC = 5
+RECENTLY_DONE_MAX = 512
+_recently_done = OrderedDict()
+
+
+def _recently_done_key(path: Path, st: os.stat_result) -> tuple:
+    """処理済み記録のキー（ファイル名・サイズ・更新時刻）"""
+    return (os.path.normcase(path.name), st.st_size, st.st_mtime_ns)
+
+
+def mark_recently_done(path: Path, st: os.stat_result) -> None:
+    """移動が完了したファイルを移動前のstatとともに記録（古いものからRECENTLY_DONE_MAX件を超えた分を削除）"""
+    key = _recently_done_key(path, st)
+    with _dispatched_lock:
+        _recently_done[key] = time.monotonic()
+        _recently_done.move_to_end(key)
+        while len(_recently_done) > RECENTLY_DONE_MAX:
+            _recently_done.popitem(last=False)
+
+
+def is_recently_done(path: Path, st: os.stat_result) -> bool:
+    """RECENTLY_DONE_SEC以内に同じファイル（名前・サイズ・更新時刻が一致）を移動済みならTrue"""
+    key = _recently_done_key(path, st)
+    with _dispatched_lock:
+        done = _recently_done.get(key)
+    return done is not None and time.monotonic() - done < RECENTLY_DONE_SEC
+
+
+def should_dispatch(path: Path) -> bool:
+    """直近DISPATCH_DEBOUNCE_SEC以内に同じパスを投入済みならFalse（投入する場合は時刻を記録）"""
+    key = _norm_key(path)
+    now = time.monotonic()
+    with _dispatched_lock:
+        last = _dispatched.get(key)
+        if last is not None and now - last < DISPATCH_DEBOUNCE_SEC:
+            return False
+        _dispatched[key] = now
+        return True
+
+
+def prune_dispatch_history() -> None:
+    """DISPATCH_HISTORY_SECより古い投入記録を削除"""
+    cutoff = time.monotonic() - DISPATCH_HISTORY_SEC
+    with _dispatched_lock:
+        for key in [key for key, last in _dispatched.items() if last < cutoff]:
+            del _dispatched[key]
+
+# PDF処理用のワーカースレッド（イベント毎にスレッドを生成せず、同時処理数を制限する）
+# （main()で起動。QR読み取りのワーカープロセスがモジュールを再インポートしても生成しない）
+PDF_WORKER_THREADS = min(4, os.cpu_count() or 2)
+pdf_executor = None
+
+# QRコード読み取り用のワーカープロセス数（popplerの呼び出しをメインプロセスから分離して並列化）
+QR_WORKER_PROCESSES = 2
+QR_WORKER_TIMEOUT_SEC = 60
+
+# QRコード読み取り用のワーカープール（main()で起動）
+qr_pool = None
+
+# 停止要求（main()の待機ループを終了させる）
+_shutdown = threading.Event()
+
+# ネットワークドライブを監視する場合のフォルダ走査間隔（秒）
+POLL_INTERVAL_SEC = 2.0
+
+# イベントが捨てられたまま残ったPDFを拾い直すためのフォルダ走査間隔（秒）
+SWEEP_INTERVAL_SEC = 10.0
+
+
+def is_network_path(path: Path) -> bool:
+    """パスがネットワーク上（UNCパスまたはネットワークドライブ）にあるか判定"""
+    path_str = str(path)
+    if path_str.startswith("\\\\"):
+        return True
+    if not HAS_WIN32PRINT or not path.anchor:
+        return False
+    try:
+        return win32file.GetDriveType(path.anchor) == win32file.DRIVE_REMOTE
+    except Exception as e:
+        logging.debug(f"ドライブ種別の取得に失敗しました: {path.anchor}, {e}")
+        return False
 
 
 # ==========================
 # ログ設定
 # ==========================
-# ルートロガーを設定
-root_logger = logging.getLogger()
-root_logger.setLevel(logging.INFO)
+LOG_FILE = "scan_printer_yotsuya.log"
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
-# 既存のハンドラーをクリア
-root_logger.handlers.clear()
+# コンソール・ファイルへの出力を行うスレッドと、そのキュー（setup_logging()で起動）
+# QR読み取りのワーカープロセスも同じキューへ送り、ログファイルへの書き込みはメインプロセスに集約する
+log_queue = None
+log_listener = None
 
-# コンソールハンドラー（必ず表示されるように）
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
-console_handler.setFormatter(console_formatter)
-root_logger.addHandler(console_handler)
 
-# ファイルハンドラー
-file_handler = logging.FileHandler("scan_printer_yotsuya.log", encoding="utf-8")
-file_handler.setLevel(logging.INFO)
-file_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
-file_handler.setFormatter(file_formatter)
-root_logger.addHandler(file_handler)
+def setup_logging() -> None:
+    """ルートロガーを設定（main()からのみ呼ぶ。QR読み取りのワーカープロセスは
+    Windowsではモジュールを再インポートするため、モジュール読み込み時にはハンドラーを作らない）"""
+    global log_queue, log_listener
+    
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    
+    # 既存のハンドラーをクリア
+    root_logger.handlers.clear()
+    
+    # コンソールハンドラー（必ず表示されるように）
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+    
+    # ファイルハンドラー
+    file_handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+    
+    # コンソール・ファイルへの出力は専用スレッド（QueueListener）で行い、
+    # イベント処理中のスレッドがディスク書き込みを待たないようにする
+    # （ワーカープロセスからも送れるよう、multiprocessing.Queueを使う）
+    log_queue = multiprocessing.Queue(-1)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    log_listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+
+def _init_qr_worker(queue_from_main) -> None:
+    """QR読み取りワーカープロセスの初期化（ログはメインプロセスのQueueListenerへ送る）"""
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.handlers.clear()
+    root_logger.addHandler(logging.handlers.QueueHandler(queue_from_main))
 
 
 # ==========================
 # ユーティリティ
 # ==========================
-def wait_until_file_stable(path: Path) -> bool:
-    """書き込み中ファイルを避けるため、サイズが一定になるまで待つ"""
-    last = -1
-    stable = 0
-    for _ in range(STABLE_CHECK_COUNT * 5):
+def record_write_event(path: Path) -> None:
+    """watchdogの書き込みイベントを記録し、安定化待ちのスレッドを起こす"""
+    with _write_event_cond:
+        last_write_events[_norm_key(path)] = time.monotonic()
+        _write_event_cond.notify_all()
+
+
+def _wait_for_write_quiet(key: str, timeout: float) -> bool:
+    """書き込みイベントがWRITE_EVENT_QUIET_SEC途絶えるまで待つ（ポーリングせずイベントの通知で起床）
+    イベントを受け取っていないファイル、またはタイムアウトした場合はFalse"""
+    deadline = time.monotonic() + timeout
+    with _write_event_cond:
+        while True:
+            last_event = last_write_events.get(key)
+            if last_event is None:
+                return False
+            now = time.monotonic()
+            quiet_remaining = last_event + WRITE_EVENT_QUIET_SEC - now
+            if quiet_remaining <= 0:
+                return True
+            if now >= deadline:
+                return False
+            _write_event_cond.wait(min(quiet_remaining, deadline - now))
+
+
+def _has_pdf_eof(path: Path, size: int) -> bool:
+    """ファイル末尾PDF_TAIL_CHECK_BYTES以内に%%EOFがあるか"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(0, size - PDF_TAIL_CHECK_BYTES))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+
+def wait_until_file_stable(
+    path: Path,
+    stable_count: int = STABLE_CHECK_COUNT,
+    initial_stat: Optional[os.stat_result] = None
+) -> bool:
+    """書き込み中ファイルを避けるため、サイズが一定になるまで待つ
+    watchdogの書き込みイベントを受け取っているファイルは、イベントが途絶えた時点で安定扱いにする
+    （ネットワークドライブなどイベントが届かない場合はサイズのポーリングのみで判定）
+    PollingObserverなどイベントの間隔がWRITE_EVENT_QUIET_SECより長い場合は、
+    イベントの途絶では判定せずSTABLE_CHECK_COUNT回分のサイズ安定を待つ
+    いずれの場合も末尾に%%EOFがなければ書き込み途中とみなす
+    initial_statを渡した場合は、ポーリングの1回目のサイズとして使う（呼び出し元で取得済みのstatを再利用）"""
+    key = _norm_key(path)
+    use_write_events = _observer_event_interval <= WRITE_EVENT_QUIET_SEC
+    if not use_write_events:
+        stable_count = max(stable_count, STABLE_CHECK_COUNT)
+    
+    # 書き込みイベントを待つ場合は、待機後のサイズと比べられないため使わない
+    if use_write_events and key in last_write_events:
+        initial_stat = None
+    
+    # イベント駆動で待機：最後の書き込みイベントから一定時間経過したら、短い間隔でサイズを1回だけ確認
+    if use_write_events and _wait_for_write_quiet(key, STABLE_CHECK_INTERVAL_SEC * STABLE_CHECK_COUNT * 5):
         try:
-            size = path.stat().st_size
+            size = os.stat(path).st_size
+            time.sleep(WRITE_CONFIRM_SEC)
+            if size > 0 and os.stat(path).st_size == size and _has_pdf_eof(path, size):
+                return True
         except FileNotFoundError:
             return False
+    
+    # フォールバック：サイズのポーリング
+    last = -1
+    stable = 0
+    for _ in range(STABLE_CHECK_COUNT * 5):
+        if initial_stat is not None:
+            size = initial_stat.st_size
+            initial_stat = None
+        else:
+            try:
+                size = os.stat(path).st_size
+            except FileNotFoundError:
+                return False
 
         if size == last and size > 0:
             stable += 1
-            if stable >= STABLE_CHECK_COUNT:
+            if stable >= stable_count and _has_pdf_eof(path, size):
+                return True
+            last_event = last_write_events.get(key) if use_write_events else None
+            write_quiet = last_event is not None and time.monotonic() - last_event >= WRITE_EVENT_QUIET_SEC
+            if write_quiet and _has_pdf_eof(path, size):
                 return True
         else:
             stable = 0
@@ -225,21 +535,53 @@ def wait_until_file_stable(path: Path) -> bool:
     return False
 
 
+# PRINT_IDマッピングのキャッシュ（ファイルの更新時刻とサイズが変わった場合のみ再読み込み）
+_mapping_cache = {"mtime": None, "size": None, "data": {}}
+
+
+def is_pdf_file(path: Path) -> bool:
+    """ファイル先頭のヘッダー（%PDF-）でPDFかどうかを判定"""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(PDF_HEADER_SEARCH_BYTES)
+    except OSError:
+        return False
+    return b"%PDF-" in header
+
+
 def load_print_id_mapping() -> dict:
-    """PRINT_IDとファイル名のマッピングを読み込む"""
+    """PRINT_IDとファイル名のマッピングを読み込む（変更がなければキャッシュを返す）"""
+    try:
+        stat = PRINT_ID_MAPPING_FILE.stat()
+    except OSError:
+        return {}
+    
+    if _mapping_cache["mtime"] == stat.st_mtime_ns and _mapping_cache["size"] == stat.st_size:
+        return _mapping_cache["data"]
+    
     mapping = {}
-    if PRINT_ID_MAPPING_FILE.exists():
-        try:
-            with open(PRINT_ID_MAPPING_FILE, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    print_id = row.get("print_id", "").strip()
-                    filename = row.get("filename", "").strip()
-                    if print_id and filename:
-                        mapping[print_id] = filename
-            logging.info(f"PRINT_IDマッピングを読み込みました: {len(mapping)}件")
-        except Exception as e:
-            logging.warning(f"マッピングファイルの読み込みエラー: {e}")
+    try:
+        with open(PRINT_ID_MAPPING_FILE, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            id_index = header.index("print_id")
+            filename_index = header.index("filename")
+            min_len = max(id_index, filename_index) + 1
+            for row in reader:
+                if len(row) < min_len:
+                    continue
+                print_id = row[id_index].strip()
+                filename = row[filename_index].strip()
+                if print_id and filename:
+                    mapping[print_id] = filename
+        logging.info(f"PRINT_IDマッピングを読み込みました: {len(mapping)}件")
+    except Exception as e:
+        logging.warning(f"マッピングファイルの読み込みエラー: {e}")
+        return mapping
+    
+    _mapping_cache["mtime"] = stat.st_mtime_ns
+    _mapping_cache["size"] = stat.st_size
+    _mapping_cache["data"] = mapping
     return mapping
 
 
@@ -258,9 +600,183 @@ def guess_filename_from_scan_name(scan_filename: str) -> Optional[str]:
     return guessed
 
 
+# PDF検索フォルダ配下のPDF一覧のキャッシュ（フォルダごと）
+# 値: {"mtime": フォルダのst_mtime_ns, "entries": [(ファイル名小文字, 親フォルダ名小文字, Path), ...]}
+_pdf_index = {}
+
+
+def _scan_pdf_files(root: Path) -> list:
+    """os.scandirでフォルダ配下のPDFファイルを再帰的に列挙"""
+    entries = []
+    stack = [str(root)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith(".pdf") and entry.is_file():
+                            entries.append((
+                                entry.name.lower(),
+                                os.path.basename(current).lower(),
+                                Path(entry.path)
+                            ))
+                    except OSError:
+                        continue
+        except OSError as e:
+            logging.debug(f"フォルダの列挙に失敗: {current}, {e}")
+    return entries
+
+
+def get_pdf_index(root: Path, refresh: bool = False) -> tuple[list, bool]:
+    """フォルダ配下のPDF一覧をキャッシュから取得
+    戻り値: (エントリ一覧, 今回再構築したかどうか)"""
+    key = str(root)
+    try:
+        mtime = root.stat().st_mtime_ns
+    except OSError:
+        _pdf_index.pop(key, None)
+        return [], False
+    
+    cached = _pdf_index.get(key)
+    if cached is not None and not refresh and cached["mtime"] == mtime:
+        return cached["entries"], False
+    
+    entries = _scan_pdf_files(root)
+    by_dir = {}
+    for _, _, path in entries:
+        by_dir.setdefault(os.path.normcase(str(path.parent)), []).append(path)
+    _pdf_index[key] = {"mtime": mtime, "entries": entries, "by_dir": by_dir}
+    logging.info(f"PDFインデックスを更新しました: {root} ({len(entries)}件)")
+    return entries, True
+
+
+def find_pdf_in_index(root: Path, name_suffix: str, parent_suffix: Optional[str] = None) -> Optional[Path]:
+    """インデックスからファイル名（と親フォルダ名）の末尾が一致するPDFを検索
+    サブフォルダ内の追加はフォルダの更新時刻に反映されないため、見つからない場合は1回だけ再構築して再検索する"""
+    # 浅い階層に置かれている場合はフォルダを走査せずに見つける（stat 1回）
+    direct_path = root / parent_suffix / name_suffix if parent_suffix else root / name_suffix
+    if direct_path.is_file():
+        return direct_path
+    
+    name_suffix = name_suffix.lower()
+    parent_suffix = parent_suffix.lower() if parent_suffix else None
+    
+    refresh = False
+    while True:
+        entries, rebuilt = get_pdf_index(root, refresh=refresh)
+        for name, parent, path in entries:
+            if not name.endswith(name_suffix):
+                continue
+            if parent_suffix is not None and (name != name_suffix or not parent.endswith(parent_suffix)):
+                continue
+            if path.is_file():
+                return path
+        if rebuilt or refresh:
+            return None
+        refresh = True
+
+
+def list_pdfs_in_folder(root: Path, folder_dir: Path) -> list:
+    """インデックスからfolder_dir直下のPDF一覧を取得（フォルダを走査しない）
+    インデックスにフォルダがない場合は1回だけ再構築して再取得する"""
+    folder_key = os.path.normcase(str(folder_dir))
+    refresh = False
+    while True:
+        _, rebuilt = get_pdf_index(root, refresh=refresh)
+        cached = _pdf_index.get(str(root))
+        pdfs = cached["by_dir"].get(folder_key) if cached else None
+        if pdfs or rebuilt or refresh:
+            return pdfs or []
+        refresh = True
+
+def _split_name_tokens(name: str) -> list:
+    """ファイル名をアンダースコア・ハイフン・空白で分割"""
+    return name.replace("_", " ").replace("-", " ").split()
+
+
+def find_similar_pdf(original_name: str, candidates) -> tuple:
+    """ファイル名（拡張子なし）の類似度で候補から最も近いPDFを検索
+    戻り値: (PDFパス, スコア)。候補がなければ (None, 0.0)"""
+    target = original_name.lower()
+    target_tokens = set(_split_name_tokens(target))
+    # キーワードを抽出（キーワードが含まれている場合はボーナス）
+    keywords = [k for k in _split_name_tokens(original_name) if len(k) > 1]
+    
+    # 比較対象（seq2）の索引は1回だけ作成し、候補ごとにseq1だけを差し替える
+    matcher = difflib.SequenceMatcher(None)
+    matcher.set_seq2(target)
+    
+    best_match = None
+    best_score = 0.0
+    
+    for pdf_file in candidates:
+        pdf_name = pdf_file.stem
+        pdf_name_lower = pdf_name.lower()
+        # 完全一致（大文字小文字の違いのみ）なら類似度を計算せずに確定
+        if pdf_name_lower == target:
+            return pdf_file, 1.0
+        # 共通する語が1つもない候補は類似度を計算しない
+        if target_tokens.isdisjoint(_split_name_tokens(pdf_name_lower)):
+            continue
+        
+        keyword_match = sum(1 for kw in keywords if kw in pdf_name)
+        bonus = keyword_match * 0.2
+        
+        if HAS_RAPIDFUZZ:
+            # difflibのratioとほぼ同じ尺度（最長共通部分列に基づく 2*一致数/総文字数）をC++実装で計算
+            score = fuzz.ratio(target, pdf_name_lower) / 100 + bonus
+        else:
+            matcher.set_seq1(pdf_name_lower)
+            # 上限値（quick_ratio）でも現在の最高スコアを超えない場合は正確な類似度を計算しない
+            if matcher.quick_ratio() + bonus <= best_score:
+                continue
+            score = matcher.ratio() + bonus
+        
+        if score > best_score:
+            best_score = score
+            best_match = pdf_file
+    
+    return best_match, best_score
+
+# 印刷対象PDFの検索結果のキャッシュ（(FILE, スキャンファイル名, PDF_DIRの更新時刻) -> Path）
+PDF_PATH_CACHE_SIZE = 1024
+_pdf_path_cache = {}
+
+
 def get_print_pdf_path(original_filename: Optional[str] = None, scan_filename: Optional[str] = None) -> Optional[Path]:
-    """ファイル名でPDFファイルのパスを取得"""
-    import difflib
+    """ファイル名でPDFファイルのパスを取得（同じファイル名の再検索はキャッシュを返す）
+    見つからなかった結果は、後からサブフォルダにPDFが追加される場合があるためキャッシュしない
+    サブフォルダへの追加ではPDF_DIRの更新時刻が変わらないため、FILE=と完全一致するPDFはキャッシュより先に確認する"""
+    if original_filename:
+        exact_path = PDF_DIR / original_filename.strip()
+        if exact_path.is_file():
+            logging.info(f"印刷対象PDFを発見（QRコードのFILE）: {exact_path}")
+            return exact_path
+    
+    try:
+        dir_mtime = PDF_DIR.stat().st_mtime_ns
+    except OSError:
+        dir_mtime = None
+    key = (original_filename, scan_filename, dir_mtime)
+    
+    cached = _pdf_path_cache.get(key)
+    if cached is not None and cached.is_file():
+        logging.info(f"印刷対象PDFを発見（キャッシュ）: {cached}")
+        return cached
+    
+    pdf_path = _resolve_print_pdf_path(original_filename, scan_filename)
+    if pdf_path is not None:
+        if len(_pdf_path_cache) >= PDF_PATH_CACHE_SIZE:
+            _pdf_path_cache.clear()
+        _pdf_path_cache[key] = pdf_path
+    return pdf_path
+
+
+def _resolve_print_pdf_path(original_filename: Optional[str], scan_filename: Optional[str]) -> Optional[Path]:
+    """get_print_pdf_pathの本体（各方法を順に試して印刷対象PDFを検索）"""
     
     # PDF_DIRの存在確認
     logging.info(f"PDF_DIR存在確認: {PDF_DIR} -> {PDF_DIR.exists()}")
@@ -295,10 +811,10 @@ def get_print_pdf_path(original_filename: Optional[str] = None, scan_filename: O
             if "/" in original_filename or "\\" in original_filename:
                 # パス区切りがある場合は、最後のファイル名部分で検索
                 filename_part = Path(original_filename).name
-                for pdf_file in PDF_DIR.rglob(f"*{filename_part}"):
-                    if pdf_file.is_file():
-                        logging.info(f"印刷対象PDFを発見（ファイル名部分一致）: {pdf_file}")
-                        return pdf_file
+                pdf_file = find_pdf_in_index(PDF_DIR, filename_part)
+                if pdf_file:
+                    logging.info(f"印刷対象PDFを発見（ファイル名部分一致）: {pdf_file}")
+                    return pdf_file
                 
                 # フォルダパスが一致するファイルを検索
                 folder_path = "/".join(original_filename.split("/")[:-1]) if "/" in original_filename else ""
@@ -307,25 +823,9 @@ def get_print_pdf_path(original_filename: Optional[str] = None, scan_filename: O
                     if folder_dir.exists():
                         # 同じフォルダ内でファイル名のキーワードで検索
                         original_name = Path(original_filename).stem  # 拡張子なし
-                        # キーワードを抽出（アンダースコアやハイフンで分割）
-                        keywords = [k for k in original_name.replace("_", " ").replace("-", " ").split() if len(k) > 1]
-                        
-                        best_match = None
-                        best_score = 0.0
-                        
-                        for pdf_file in folder_dir.glob("*.pdf"):
-                            pdf_name = pdf_file.stem
-                            # 類似度を計算
-                            score = difflib.SequenceMatcher(None, original_name.lower(), pdf_name.lower()).ratio()
-                            
-                            # キーワードマッチング（キーワードが含まれている場合はボーナス）
-                            keyword_match = sum(1 for kw in keywords if kw in pdf_name)
-                            if keyword_match > 0:
-                                score += keyword_match * 0.2
-                            
-                            if score > best_score:
-                                best_score = score
-                                best_match = pdf_file
+                        best_match, best_score = find_similar_pdf(
+                            original_name, list_pdfs_in_folder(PDF_DIR, folder_dir)
+                        )
                         
                         if best_match and best_score > 0.3:  # 類似度30%以上
                             logging.info(f"印刷対象PDFを発見（類似度マッチング、スコア: {best_score:.2f}）: {best_match}")
@@ -344,11 +844,10 @@ def get_print_pdf_path(original_filename: Optional[str] = None, scan_filename: O
                 base_parts = guessed_filename.split("/")
                 if len(base_parts) >= 2:
                     # 最後の2つの部分（例: "6年/数の性質_連続する数の積_応用.pdf"）で検索
-                    search_pattern = "/".join(base_parts[-2:])
-                    for pdf_file in PDF_DIR.rglob(f"*{search_pattern}"):
-                        if pdf_file.is_file():
-                            logging.info(f"印刷対象PDFを発見（部分一致検索）: {pdf_file}")
-                            return pdf_file
+                    pdf_file = find_pdf_in_index(PDF_DIR, base_parts[-1], parent_suffix=base_parts[-2])
+                    if pdf_file:
+                        logging.info(f"印刷対象PDFを発見（部分一致検索）: {pdf_file}")
+                        return pdf_file
     
     # 方法3: フォールバック用のtest_pdfsフォルダを検索（PDF_DIRが異なる場合）
     fallback_pdf_dir = Path(r"C:\Users\doctor\printviewer\test_pdfs")
@@ -365,23 +864,10 @@ def get_print_pdf_path(original_filename: Optional[str] = None, scan_filename: O
             if folder_path:
                 folder_dir = fallback_pdf_dir / folder_path
                 if folder_dir.exists():
-                    import difflib
                     original_name = Path(original_filename).stem
-                    keywords = [k for k in original_name.replace("_", " ").replace("-", " ").split() if len(k) > 1]
-                    
-                    best_match = None
-                    best_score = 0.0
-                    
-                    for pdf_file in folder_dir.glob("*.pdf"):
-                        pdf_name = pdf_file.stem
-                        score = difflib.SequenceMatcher(None, original_name.lower(), pdf_name.lower()).ratio()
-                        keyword_match = sum(1 for kw in keywords if kw in pdf_name)
-                        if keyword_match > 0:
-                            score += keyword_match * 0.2
-                        
-                        if score > best_score:
-                            best_score = score
-                            best_match = pdf_file
+                    best_match, best_score = find_similar_pdf(
+                        original_name, list_pdfs_in_folder(fallback_pdf_dir, folder_dir)
+                    )
                     
                     if best_match and best_score > 0.3:
                         logging.info(f"印刷対象PDFを発見（フォールバックフォルダ、類似度マッチング、スコア: {best_score:.2f}）: {best_match}")
@@ -394,158 +880,541 @@ def get_print_pdf_path(original_filename: Optional[str] = None, scan_filename: O
             logging.info(f"印刷対象PDFを発見（中央リポジトリ）: {pdf_path}")
             return pdf_path
     
-    # 方法5: すべてのPDFをリストアップしてログに出力
-    all_pdfs = []
-    if PDF_DIR.exists():
-        all_pdfs.extend(list(PDF_DIR.rglob("*.pdf")))
-    if fallback_pdf_dir.exists() and fallback_pdf_dir != PDF_DIR:
-        all_pdfs.extend(list(fallback_pdf_dir.rglob("*.pdf")))
-    
     logging.warning(f"印刷対象PDFが見つかりません: {original_filename or scan_filename}")
-    logging.info(f"検索対象フォルダ内のPDFファイル数: {len(all_pdfs)}")
-    if len(all_pdfs) <= 20:
-        logging.info(f"利用可能なPDFファイル: {[str(p) for p in all_pdfs[:20]]}")
+    
+    # 方法5: すべてのPDFをリストアップしてログに出力（診断用のためDEBUG時のみ）
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        # インデックスの件数を数えるだけで、一覧は20件以下の場合のみ作成する
+        index_entries = [get_pdf_index(PDF_DIR)[0]]
+        if fallback_pdf_dir != PDF_DIR:
+            index_entries.append(get_pdf_index(fallback_pdf_dir)[0])
+        pdf_count = sum(len(entries) for entries in index_entries)
+        
+        logging.debug(f"検索対象フォルダ内のPDFファイル数: {pdf_count}")
+        if pdf_count <= 20:
+            sample = itertools.islice(itertools.chain.from_iterable(index_entries), 20)
+            logging.debug(f"利用可能なPDFファイル: {[str(path) for _, _, path in sample]}")
     
     return None
 
 
+# 保存済みのマッピング（初回の保存時にマッピングファイルから読み込む）と追記用のファイルハンドル
+_mapping_saved = None
+_mapping_fh = None
+_mapping_writer = None
+_mapping_save_lock = threading.Lock()
+
+
+def _close_mapping_file():
+    """終了時にマッピングファイルの追記用ハンドルを閉じる"""
+    global _mapping_fh, _mapping_writer
+    with _mapping_save_lock:
+        if _mapping_fh is not None:
+            _mapping_fh.close()
+            _mapping_fh = None
+            _mapping_writer = None
+
+
 def save_print_id_mapping(print_id: str, filename: str):
-    """PRINT_IDとファイル名のマッピングを保存"""
-    file_exists = PRINT_ID_MAPPING_FILE.exists()
+    """PRINT_IDとファイル名のマッピングを保存（新しいPRINT_IDのみ1行追記）
+    追記用のハンドルは開いたままにし、書き込み毎にディスクへ反映する"""
+    global _mapping_saved, _mapping_fh, _mapping_writer
     
-    # 既存のマッピングを読み込む
-    existing_mappings = {}
-    if file_exists:
+    with _mapping_save_lock:
+        if _mapping_saved is None:
+            _mapping_saved = dict(load_print_id_mapping())
+        
+        # 既に存在する場合はスキップ
+        if print_id in _mapping_saved:
+            return
+        
+        # 新しいマッピングを追記
         try:
-            with open(PRINT_ID_MAPPING_FILE, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    existing_mappings[row["print_id"]] = row["filename"]
+            if _mapping_fh is None:
+                _mapping_fh = open(PRINT_ID_MAPPING_FILE, "a", encoding="utf-8", newline="")
+                _mapping_writer = csv.writer(_mapping_fh)
+                if os.fstat(_mapping_fh.fileno()).st_size == 0:
+                    _mapping_writer.writerow(["print_id", "filename"])
+                atexit.register(_close_mapping_file)
+            _mapping_writer.writerow([print_id, filename])
+            _mapping_fh.flush()
+            os.fsync(_mapping_fh.fileno())
+            _mapping_saved[print_id] = filename
+            logging.info(f"マッピングを保存しました: {print_id} -> {filename}")
         except Exception as e:
-            logging.warning(f"マッピングファイル読み込みエラー: {e}")
-    
-    # 既に存在する場合はスキップ
-    if print_id in existing_mappings:
-        return
+            logging.warning(f"マッピングファイル保存エラー: {e}")
+
+
+# OpenCVのQRコード検出器（スレッドごとに1つ生成して使い回す）
+_qr_detector_local = threading.local()
+
+
+def get_qr_detector():
+    """このスレッド用のcv2.QRCodeDetectorを取得"""
+    detector = getattr(_qr_detector_local, "detector", None)
+    if detector is None:
+        detector = cv2.QRCodeDetector()
+        _qr_detector_local.detector = detector
+    return detector
+
+
+def decode_qr_with_crop(image) -> list:
+    """OpenCVでQRコードの位置を大まかに検出し、その周辺だけをpyzbarに渡す
+    位置が検出できない・切り出した画像で読めない場合は画像全体をpyzbarに渡す
+    戻り値: pyzbarの検出結果"""
+    if HAS_CV2:
+        try:
+            gray = np.asarray(image if image.mode == "L" else image.convert("L"))
+            found, points = get_qr_detector().detect(gray)
+            if found and points is not None:
+                points = points.reshape(-1, 2)
+                x0, y0 = points.min(axis=0)
+                x1, y1 = points.max(axis=0)
+                pad_x = (x1 - x0) * QR_CROP_PADDING_RATIO
+                pad_y = (y1 - y0) * QR_CROP_PADDING_RATIO
+                height, width = gray.shape[:2]
+                left = max(int(x0 - pad_x), 0)
+                top = max(int(y0 - pad_y), 0)
+                right = min(int(x1 + pad_x) + 1, width)
+                bottom = min(int(y1 + pad_y) + 1, height)
+                
+                crop = gray[top:bottom, left:right]
+                if crop.size > 0:
+                    long_side = max(crop.shape[:2])
+                    if long_side > QR_CROP_MAX_SIDE:
+                        scale = QR_CROP_MAX_SIDE / long_side
+                        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                    qr_codes = pyzbar_decode(np.ascontiguousarray(crop), symbols=QR_SYMBOLS)
+                    if qr_codes:
+                        return qr_codes
+                    logging.debug("切り出した領域ではQRコードを読み取れませんでした。画像全体で再試行します")
+        except Exception as e:
+            logging.debug(f"QRコード位置の検出をスキップ: {e}")
     
-    # 新しいマッピングを追加
-    existing_mappings[print_id] = filename
+    # QRコードは通常ページ上部にあるため、まず上部だけをpyzbarに渡す（読めなければページ全体）
+    width, height = image.size
+    qr_codes = pyzbar_decode(image.crop((0, 0, width, int(height * QR_TOP_REGION_RATIO))), symbols=QR_SYMBOLS)
+    if qr_codes:
+        return qr_codes
+    return pyzbar_decode(image, symbols=QR_SYMBOLS)
+
+
+def decode_qr_from_embedded_images(pdf_path: Path, doc) -> list:
+    """PDFの1ページ目に埋め込まれた画像をそのままpyzbarに渡してQRコードを検出
+    （QRコードが画像として埋め込まれている場合はラスタライズを省略できる）
+    doc: 開いておいたPyMuPDFのドキュメント（Noneの場合は何もしない）
+    戻り値: pyzbarの検出結果（見つからなければ空リスト）"""
+    if doc is None:
+        return []
     
-    # 保存
     try:
-        with open(PRINT_ID_MAPPING_FILE, "w", encoding="utf-8", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=["print_id", "filename"])
-            writer.writeheader()
-            for pid, fname in existing_mappings.items():
-                writer.writerow({
-                    "print_id": pid,
-                    "filename": fname
-                })
-        logging.info(f"マッピングを保存しました: {print_id} -> {filename}")
+        if doc.page_count < 1:
+            return []
+        for image_info in doc.load_page(0).get_images(full=True):
+            xref, width, height = image_info[0], image_info[2], image_info[3]
+            if width * height > QR_EMBEDDED_IMAGE_MAX_PIXELS:
+                continue
+            extracted = doc.extract_image(xref)
+            if not extracted:
+                continue
+            with Image.open(io.BytesIO(extracted["image"])) as image:
+                qr_codes = pyzbar_decode(image, symbols=QR_SYMBOLS)
+            if qr_codes:
+                logging.info(f"埋め込み画像からQRコードを検出: {pdf_path} (xref={xref}, {width}x{height})")
+                return qr_codes
     except Exception as e:
-        logging.warning(f"マッピングファイル保存エラー: {e}")
+        logging.debug(f"埋め込み画像からのQRコード検出をスキップ: {pdf_path}, {e}")
+    
+    return []
+
+
+def render_first_page(pdf_path: Path, dpi: int, doc=None):
+    """PDFの1ページ目をグレースケール画像（PIL）に変換
+    PyMuPDFのドキュメント（doc）が渡されればプロセス内でレンダリングし、なければpdf2image（poppler）を使用
+    戻り値: PIL.Image（取得できなければNone）"""
+    if doc is not None:
+        try:
+            if doc.page_count < 1:
+                return None
+            pix = doc[0].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+            return Image.frombuffer("L", (pix.width, pix.height), pix.samples, "raw", "L", pix.stride, 1).copy()
+        except Exception as e:
+            if not HAS_PDF2IMAGE:
+                raise
+            logging.debug(f"PyMuPDFでのレンダリングに失敗したため、popplerで再試行します: {e}")
+    
+    images = convert_from_path(
+        str(pdf_path),
+        first_page=1,
+        last_page=1,
+        dpi=dpi,
+        grayscale=True,
+        poppler_path=POPPLER_PATH,
+        use_pdftocairo=True
+    )
+    return images[0] if images else None
+
+
+def find_qr_codes(pdf_path: Path) -> Optional[list]:
+    """PDFの1ページ目からQRコードを検出（PDFは1回だけ開き、埋め込み画像の確認とレンダリングで共用）
+    戻り値: pyzbarの検出結果（ページを画像化できなければNone）"""
+    doc = None
+    if HAS_FITZ:
+        try:
+            doc = fitz.open(str(pdf_path))
+        except Exception as e:
+            logging.debug(f"PyMuPDFでPDFを開けませんでした: {pdf_path}, {e}")
+    
+    try:
+        # まずPDFに埋め込まれた画像から直接QRコードを探す（ラスタライズ不要）
+        qr_codes = decode_qr_from_embedded_images(pdf_path, doc)
+        
+        # 見つからなければ、PDFの1ページ目を低解像度のグレースケール画像に変換
+        # （QRコードの検出には輝度のみで十分。読めなかった場合は解像度を上げて再試行）
+        for dpi in QR_RENDER_DPIS:
+            if qr_codes:
+                break
+            image = render_first_page(pdf_path, dpi, doc)
+            if image is None:
+                return None
+            
+            # QRコード周辺を切り出してpyzbarで検出
+            qr_codes = decode_qr_with_crop(image)
+            if not qr_codes:
+                logging.info(f"QRコードが検出されませんでした（{dpi}dpi）: {pdf_path}")
+        
+        return qr_codes
+    finally:
+        if doc is not None:
+            doc.close()
 
 
 def extract_print_id_from_qr(pdf_path: Path) -> tuple[Optional[str], Optional[str], Optional[str]]:
     """PDFの1ページ目からQRコードを読み取り、PRINT_ID、FILE、PRINTERを抽出
     戻り値: (print_id, original_filename, printer_name)"""
-    if not HAS_PDF2IMAGE or not HAS_PYZBAR:
+    if not (HAS_FITZ or HAS_PDF2IMAGE) or not HAS_PYZBAR:
         logging.error("必要なライブラリがインストールされていません")
         return None, None, None
     
     try:
-        # PDFの1ページ目を画像に変換
-        images = convert_from_path(
-            str(pdf_path),
-            first_page=1,
-            last_page=1,
-            poppler_path=POPPLER_PATH
-        )
-        
-        if not images:
+        qr_codes = find_qr_codes(pdf_path)
+        if qr_codes is None:
             logging.warning(f"PDFから画像を取得できませんでした: {pdf_path}")
             return None, None, None
         
-        # QRコードを検出
-        for image in images:
-            # pyzbarでQRコードを検出（PIL Imageをそのまま使用）
-            qr_codes = pyzbar_decode(image)
-            
-            if not qr_codes:
-                continue
-            
-            # QRコードが複数ある場合はエラー
-            if len(qr_codes) > 1:
-                logging.warning(f"QRコードが複数検出されました: {pdf_path}")
-                return None, None, None
-            
-            # QRコードデータを取得
-            qr_data = qr_codes[0].data.decode('utf-8')
-            logging.info(f"QRコード検出（全内容）: {qr_data}")
-            
-            # PRINT_ID=QS_...,FILE=ファイル名,PRINTER=プリンター名 の形式から情報を抽出
-            import re
-            print_id = None
+        if not qr_codes:
+            logging.warning(f"QRコードが検出されませんでした: {pdf_path}")
+            return None, None, None
+        
+        # QRコードが複数ある場合はエラー
+        if len(qr_codes) > 1:
+            logging.warning(f"QRコードが複数検出されました: {pdf_path}")
+            return None, None, None
+        
+        # QRコードデータを取得
+        qr_data = qr_codes[0].data.decode('utf-8')
+        logging.info(f"QRコード検出（全内容）: {qr_data}")
+        
+        # PRINT_ID=QS_...,FILE=ファイル名,PRINTER=プリンター名 の形式から情報を1回の走査で抽出
+        # （各キーとも最初の出現を採用）
+        fields = {}
+        for match in QR_FIELD_PATTERN.finditer(qr_data):
+            key = match.group(1) or "FILE"
+            value = match.group(2) if match.group(1) else match.group(3)
+            fields.setdefault(key, value.strip())
+        
+        # PRINT_IDを抽出（カンマまたは空白で区切られる。旧形式の PRINT_ID=... のみのQRもここで取得できる）
+        print_id = fields.get("PRINT_ID")
+        if print_id:
+            logging.info(f"PRINT_ID抽出: {print_id}")
+        
+        # FILEを抽出（カンマで区切られる、または末尾まで）
+        encoded_filename = fields.get("FILE")
+        if encoded_filename:
+            # URLデコードして元のファイル名に戻す
+            original_filename = unquote(encoded_filename)
+            logging.info(f"FILE抽出（エンコード前）: {encoded_filename}")
+            logging.info(f"FILE抽出（デコード後）: {original_filename}")
+        else:
+            logging.warning(f"QRコードにFILE=が含まれていません: {qr_data}")
             original_filename = None
-            printer_name = None
-            
-            # PRINT_IDを抽出（カンマまたは空白で区切られる）
-            match = re.search(r'PRINT_ID=([^,\s]+)', qr_data)
-            if match:
-                print_id = match.group(1).strip()
-                logging.info(f"PRINT_ID抽出: {print_id}")
-            else:
-                # 旧形式（PRINT_ID=のみ）にも対応
-                match = re.match(r'PRINT_ID=(\S+)', qr_data)
-                if match:
-                    print_id = match.group(1).strip()
-                    logging.info(f"PRINT_ID抽出（旧形式）: {print_id}")
-            
-            # FILEを抽出（カンマで区切られる、または末尾まで）
-            # FILE=から次のカンマ、または文字列の終わりまでの部分を取得
-            match = re.search(r'FILE=([^,]+)', qr_data)
-            if match:
-                encoded_filename = match.group(1).strip()
-                # URLデコードして元のファイル名に戻す
-                original_filename = unquote(encoded_filename)
-                logging.info(f"FILE抽出（エンコード前）: {encoded_filename}")
-                logging.info(f"FILE抽出（デコード後）: {original_filename}")
-            else:
-                logging.warning(f"QRコードにFILE=が含まれていません: {qr_data}")
-                original_filename = None
-            
-            # PRINTERを抽出（カンマで区切られる）
-            match = re.search(r'PRINTER=([^,\s]+)', qr_data)
-            if match:
-                printer_name = match.group(1).strip()
-                logging.info(f"PRINTER抽出: {printer_name}")
-            
-            if print_id:
-                return print_id, original_filename, printer_name
-            else:
-                # PRINT_IDがなければエラー
-                logging.warning(f"PRINT_IDを抽出できませんでした: {qr_data}")
-                return None, None, None
         
-        logging.warning(f"QRコードが検出されませんでした: {pdf_path}")
-        return None, None, None
+        # PRINTERを抽出（カンマで区切られる）
+        printer_name = fields.get("PRINTER")
+        if printer_name:
+            logging.info(f"PRINTER抽出: {printer_name}")
+        
+        if print_id:
+            return print_id, original_filename, printer_name
+        else:
+            # PRINT_IDがなければエラー
+            logging.warning(f"PRINT_IDを抽出できませんでした: {qr_data}")
+            return None, None, None
         
     except Exception as e:
         logging.exception(f"QRコード読み取りエラー: {pdf_path}, {e}")
         return None, None, None
 
 
-def print_pdf(pdf_path: Path, printer_name: str, copies: int = 1) -> bool:
-    """PDFをWindows印刷キューに送信"""
+# QRコードの読み取り結果のキャッシュ（ファイル内容のハッシュ -> (PRINT_ID, ファイル名, プリンター名)）
+# 同じ用紙を再スキャンしてバイト単位で同一のPDFができた場合に、レンダリングとQR読み取りを省略する
+QR_RESULT_CACHE_SIZE = 256
+_qr_result_cache = OrderedDict()
+_qr_result_cache_lock = threading.Lock()
+
+
+def _file_digest(path: Path) -> Optional[str]:
+    """ファイル全体のハッシュ値（blake2b）を返す（読み取れない場合はNone）"""
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def _extract_print_id_uncached(pdf_path: Path) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    """QRコード読み取りをワーカープールで実行（プール未起動・失敗時はこのプロセスで実行）"""
+    if qr_pool is None:
+        return extract_print_id_from_qr(pdf_path)
+    
+    try:
+        result = qr_pool.apply_async(extract_print_id_from_qr, (pdf_path,))
+        return result.get(timeout=QR_WORKER_TIMEOUT_SEC)
+    except Exception as e:
+        logging.warning(f"QRワーカーでの読み取りに失敗したため、メインプロセスで再試行します: {pdf_path}, {e}")
+        return extract_print_id_from_qr(pdf_path)
+
+
+def extract_print_id_in_pool(pdf_path: Path) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    """QRコードを読み取る（内容が同一のPDFを読み取り済みならキャッシュした結果を返す）"""
+    digest = _file_digest(pdf_path)
+    if digest is not None:
+        with _qr_result_cache_lock:
+            cached = _qr_result_cache.get(digest)
+            if cached is not None:
+                _qr_result_cache.move_to_end(digest)
+        if cached is not None:
+            logging.info(f"同一内容のPDFを読み取り済みのため、QRコードの結果を再利用します: {pdf_path.name}")
+            return cached
+    
+    result = _extract_print_id_uncached(pdf_path)
+    
+    # FILE=が読み取れた場合のみキャッシュ（読み取り失敗は再スキャン時に再試行する）
+    if digest is not None and result[1]:
+        with _qr_result_cache_lock:
+            _qr_result_cache[digest] = result
+            _qr_result_cache.move_to_end(digest)
+            while len(_qr_result_cache) > QR_RESULT_CACHE_SIZE:
+                _qr_result_cache.popitem(last=False)
+    return result
+
+
+# 利用可能なプリンタ一覧のキャッシュ（EnumPrintersはネットワーク越しの問い合わせで遅いため）
+PRINTER_CACHE_TTL_SEC = 60
+_printer_cache = {"ts": None, "printers": ()}
+
+
+def get_available_printers(refresh: bool = False) -> tuple:
+    """ローカル＋ネットワークプリンタ名の一覧を取得（TTL内はキャッシュを返す。refresh=Trueで再列挙）
+    部分一致検索で列挙順に先頭から照合するため、順序を保ったタプルで返す"""
+    now = time.monotonic()
+    if not refresh and _printer_cache["ts"] is not None and now - _printer_cache["ts"] < PRINTER_CACHE_TTL_SEC:
+        return _printer_cache["printers"]
+    
+    # 接続済みのネットワークプリンタはPRINTER_ENUM_CONNECTIONSで取得できる
+    # （PRINTER_ENUM_NETWORKはネットワーク全体を探索するため数秒かかることがある）
+    flags = win32print.PRINTER_ENUM_LOCAL | win32print.PRINTER_ENUM_CONNECTIONS
+    printers = [printer[2] for printer in win32print.EnumPrinters(flags)]
+    _printer_cache["printers"] = tuple(printers)
+    _printer_cache["ts"] = now
+    return _printer_cache["printers"]
+
+
+# Adobe Readerのパス候補（起動時に1回だけ存在確認する）
+ACROBAT_PATHS = [
+    r"C:\Program Files\Adobe\Acrobat DC\Acrobat\Acrobat.exe",
+    r"C:\Program Files (x86)\Adobe\Acrobat Reader DC\Reader\AcroRd32.exe",
+    r"C:\Program Files\Adobe\Acrobat Reader DC\Reader\AcroRd32.exe",
+]
+ACROBAT_PATH = next((path for path in ACROBAT_PATHS if Path(path).exists()), None)
+
+# PDFビューアを起動せずにプロセス内でレンダリングしてGDIで印刷するか
+# （ページを画像として印刷するため文字の品質が落ちる場合がある。またNup設定の強制はPDFビューア経由の印刷でのみ行う）
+GDI_PRINT_ENABLED = False
+GDI_PRINT_MAX_PAGES = 2  # これより多いページ数のPDFはPDFビューアで印刷
+GDI_PRINT_DPI = 300  # レンダリング解像度の上限（プリンタの解像度がこれより低ければそちらに合わせる）
+
+# UNCパスのPDFを印刷前に一時フォルダへコピーするか
+# （PDFビューアがUNCパスを開けない環境でのみTrueにする）
+COPY_UNC_TO_TEMP = False
+
+# Nup設定の確認が不要なプリンタ（既に1、または権限不足で変更できないことを確認済み）
+_nup_checked_printers = set()
+
+# 印刷後の一時ファイル削除（PDFビューアが読み込み終わるまで待ってから削除する）
+TEMP_FILE_DELETE_DELAY_SEC = 10
+_cleanup_heap = []  # (削除予定時刻, Path) のヒープ
+_cleanup_cond = threading.Condition()
+_cleanup_thread = None
+
+
+def _cleanup_worker():
+    """削除予定時刻になった一時ファイルを順に削除する（常駐スレッド1本で処理）"""
+    while True:
+        with _cleanup_cond:
+            while not _cleanup_heap:
+                _cleanup_cond.wait()
+            deadline, path = _cleanup_heap[0]
+            now = time.monotonic()
+            if now < deadline:
+                _cleanup_cond.wait(deadline - now)
+                continue
+            heapq.heappop(_cleanup_heap)
+        try:
+            if path.exists():
+                path.unlink()
+                logging.info(f"一時ファイルを削除: {path}")
+        except Exception as e:
+            logging.warning(f"一時ファイル削除エラー: {e}")
+
+
+def schedule_unlink(path: Path, delay: float = TEMP_FILE_DELETE_DELAY_SEC) -> None:
+    """delay秒後に一時ファイルを削除するよう登録（ジョブ毎にスレッドを生成しない）"""
+    global _cleanup_thread
+    with _cleanup_cond:
+        if _cleanup_thread is None:
+            _cleanup_thread = threading.Thread(target=_cleanup_worker, name="temp_cleanup", daemon=True)
+            _cleanup_thread.start()
+        heapq.heappush(_cleanup_heap, (time.monotonic() + delay, path))
+        _cleanup_cond.notify()
+
+
+# 一時フォルダへのコピーなど、印刷準備と並行させるファイルI/O用のワーカースレッド
+io_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="io_worker")
+
+# PDFを直接受け付ける可能性のあるプリンタのドライバ名キーワード
+# （RAW送信への切り替えはprinters.yamlの direct_pdf: true で明示的に行い、ここではログでの案内のみ）
+DIRECT_PDF_DRIVER_KEYWORDS = ("Apeos",)
+RAW_PRINT_CHUNK_SIZE = 1024 * 1024
+
+# ドライバ名の確認を済ませたプリンタ名（案内ログはプリンタごとに1回だけ出す）
+_direct_pdf_hinted = set()
+
+
+def _log_direct_pdf_hint(printer_name: str) -> None:
+    """ドライバ名がPDFダイレクトプリント対応機らしい場合に、設定方法をログで案内する"""
+    if printer_name in _direct_pdf_hinted:
+        return
+    _direct_pdf_hinted.add(printer_name)
+    
+    try:
+        handle = win32print.OpenPrinter(printer_name)
+        try:
+            driver_name = win32print.GetPrinter(handle, 2).get("pDriverName") or ""
+        finally:
+            win32print.ClosePrinter(handle)
+    except Exception as e:
+        logging.debug(f"プリンタドライバ名の取得エラー（無視）: {printer_name}: {e}")
+        return
+    
+    if any(keyword.lower() in driver_name.lower() for keyword in DIRECT_PDF_DRIVER_KEYWORDS):
+        logging.info(f"'{printer_name}' ({driver_name}) はPDFダイレクト印刷に対応している可能性があります "
+                     f"(printers.yamlで direct_pdf: true を指定するとRAW送信します)")
+
+
+def is_direct_pdf_printer(printer_name: str) -> bool:
+    """printers.yamlで direct_pdf: true が指定されたプリンタかを判定（既定はFalse）"""
+    for settings in load_printer_config().values():
+        config_printer_name = (settings or {}).get("printer_name", "")
+        if not config_printer_name:
+            continue
+        if (config_printer_name == printer_name or config_printer_name in printer_name) and settings.get("direct_pdf"):
+            return True
+    
+    _log_direct_pdf_hint(printer_name)
+    return False
+
+
+def raw_print_pdf(pdf_path: Path, printer_name: str) -> None:
+    """PDFのバイト列をRAWデータとしてスプーラに直接送信"""
+    handle = win32print.OpenPrinter(printer_name)
+    try:
+        win32print.StartDocPrinter(handle, 1, (pdf_path.name, None, "RAW"))
+        try:
+            win32print.StartPagePrinter(handle)
+            with open(pdf_path, "rb") as f:
+                while True:
+                    chunk = f.read(RAW_PRINT_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    win32print.WritePrinter(handle, chunk)
+            win32print.EndPagePrinter(handle)
+        finally:
+            win32print.EndDocPrinter(handle)
+    finally:
+        win32print.ClosePrinter(handle)
+
+
+
+def gdi_print_pdf(pdf_path: Path, printer_name: str) -> bool:
+    """PDFをプロセス内でレンダリングし、GDI（プリンタDC）へ直接描画して印刷
+    ページ数がGDI_PRINT_MAX_PAGESを超える場合は印刷せずにFalseを返す"""
+    with fitz.open(str(pdf_path)) as doc:
+        if doc.page_count < 1 or doc.page_count > GDI_PRINT_MAX_PAGES:
+            return False
+        
+        hdc = win32ui.CreateDC()
+        hdc.CreatePrinterDC(printer_name)
+        try:
+            printable_width = hdc.GetDeviceCaps(win32con.HORZRES)
+            printable_height = hdc.GetDeviceCaps(win32con.VERTRES)
+            dpi = min(hdc.GetDeviceCaps(win32con.LOGPIXELSX), GDI_PRINT_DPI)
+            
+            hdc.StartDoc(pdf_path.name)
+            try:
+                for page in doc:
+                    pix = page.get_pixmap(dpi=dpi, alpha=False)
+                    image = Image.frombuffer("RGB", (pix.width, pix.height), pix.samples, "raw", "RGB", pix.stride, 1)
+                    
+                    # 縦横比を保ったまま印刷可能領域に収める
+                    scale = min(printable_width / pix.width, printable_height / pix.height)
+                    width = int(pix.width * scale)
+                    height = int(pix.height * scale)
+                    
+                    hdc.StartPage()
+                    ImageWin.Dib(image).draw(hdc.GetHandleOutput(), (0, 0, width, height))
+                    hdc.EndPage()
+            except Exception:
+                hdc.AbortDoc()
+                raise
+            hdc.EndDoc()
+        finally:
+            hdc.DeleteDC()
+    return True
+
+def print_pdf(
+    pdf_path: Path,
+    printer_name: str,
+    copies: int = 1,
+    known_printers: Optional[tuple] = None
+) -> bool:
+    """PDFをWindows印刷キューに送信
+    known_printers: 呼び出し元で取得済みのプリンタ一覧（Noneの場合はここで取得）"""
     if not HAS_WIN32PRINT:
         logging.error("win32printが利用できません")
         return False
     
+    pdf_name = pdf_path.name
     try:
         # プリンタが存在するか確認
-        printers = [printer[2] for printer in win32print.EnumPrinters(win32print.PRINTER_ENUM_LOCAL)]
-        printers_network = [printer[2] for printer in win32print.EnumPrinters(win32print.PRINTER_ENUM_NETWORK)]
-        all_printers = printers + printers_network
+        all_printers = known_printers if known_printers is not None else get_available_printers()
+        # キャッシュした一覧で見つからない場合は、プリンタが追加された可能性があるため1回だけ再列挙
+        if find_printer_by_name(printer_name, all_printers) is None:
+            logging.info(f"プリンタ一覧のキャッシュに '{printer_name}' がないため再取得します")
+            all_printers = get_available_printers(refresh=True)
         
         # QRコードのプリンター名を実際のWindowsプリンター名にマッピング
         original_printer_name = printer_name
@@ -562,23 +1431,10 @@ def print_pdf(pdf_path: Path, printer_name: str, copies: int = 1) -> bool:
                     logging.error(f"利用可能なプリンタ: {all_printers}")
                     return False
             else:
-                # find_printer_by_nameがNoneを返した場合
-                logging.warning(f"find_printer_by_nameがNoneを返しました: '{printer_name}'")
-                if printer_name not in all_printers:
-                    logging.error(f"プリンタが見つかりません: {printer_name}")
-                    logging.error(f"利用可能なプリンタ: {all_printers}")
-                    # 部分一致で再試行
-                    logging.info(f"部分一致で再検索中...")
-                    found = False
-                    for printer in all_printers:
-                        if printer_name in printer or printer in printer_name:
-                            logging.info(f"部分一致で発見: '{printer_name}' -> '{printer}'")
-                            printer_name = printer
-                            found = True
-                            break
-                    if not found:
-                        logging.error(f"部分一致でも見つかりませんでした: '{printer_name}'")
-                        return False
+                # find_printer_by_nameがNoneを返した場合（完全一致・部分一致とも検索済み）
+                logging.error(f"プリンタが見つかりません: {printer_name}")
+                logging.error(f"利用可能なプリンタ: {all_printers}")
+                return False
         except Exception as e:
             logging.warning(f"プリンター名解決エラー: {e}。元のプリンター名 '{printer_name}' を使用します")
             # エラーが発生した場合、元のプリンター名で続行を試みる
@@ -587,39 +1443,49 @@ def print_pdf(pdf_path: Path, printer_name: str, copies: int = 1) -> bool:
                 logging.info(f"利用可能なプリンタ: {all_printers}")
                 return False
         
-        # ネットワークパス（UNCパス）の場合は一時的にローカルにコピー
+        # PDFダイレクトプリント対応機はPDFビューアを起動せず、スプーラへRAW送信する
+        try:
+            if is_direct_pdf_printer(printer_name):
+                raw_print_pdf(pdf_path, printer_name)
+                logging.info(f"印刷ジョブを投入しました（RAW送信）: {pdf_name} -> {printer_name}")
+                return True
+        except Exception as e:
+            logging.warning(f"RAW送信に失敗したため、PDFビューア経由の印刷にフォールバックします: {e}")
+        
+        # 少ページのPDFはPDFビューアを起動せず、プロセス内でレンダリングしてGDIで印刷
+        if GDI_PRINT_ENABLED and HAS_FITZ and HAS_PYZBAR:
+            try:
+                if gdi_print_pdf(pdf_path, printer_name):
+                    logging.info(f"印刷ジョブを投入しました（GDI）: {pdf_name} -> {printer_name}")
+                    return True
+            except Exception as e:
+                logging.warning(f"GDI印刷に失敗したため、PDFビューア経由の印刷にフォールバックします: {e}")
+        
+        # ネットワークパス（UNCパス）はそのままPDFビューアに渡す
+        # （COPY_UNC_TO_TEMPが有効な場合のみ一時的にローカルにコピー）
         temp_pdf_path = None
+        copy_future = None
         try:
             source_path = str(pdf_path.resolve())
             
             # UNCパス（\\で始まる）の場合は一時ファイルにコピー
-            if source_path.startswith('\\\\'):
-                import tempfile
+            # （コピーはバックグラウンドで行い、プリンター設定の確認と並行させる。PDFビューア起動前に完了を待つ）
+            if COPY_UNC_TO_TEMP and source_path.startswith('\\\\'):
                 temp_dir = Path(tempfile.gettempdir())
-                temp_pdf_path = temp_dir / f"print_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{pdf_path.name}"
+                temp_pdf_path = temp_dir / f"print_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{pdf_name}"
                 
                 logging.info(f"ネットワークパスを検出。一時ファイルにコピー: {temp_pdf_path}")
-                shutil.copy2(source_path, str(temp_pdf_path))
+                copy_future = io_executor.submit(shutil.copy2, source_path, str(temp_pdf_path))
                 abs_path = str(temp_pdf_path)
             else:
                 abs_path = source_path
+            # ShellExecuteの作業フォルダ（2つの起動方法で共通）
+            abs_parent_str = os.path.dirname(abs_path)
             
             logging.info(f"印刷を試行中: {abs_path} -> {printer_name}")
             
-            # Adobe Readerのコマンドラインオプションを使用
-            # Adobe Readerのパスを検索
-            acrobat_paths = [
-                r"C:\Program Files\Adobe\Acrobat DC\Acrobat\Acrobat.exe",
-                r"C:\Program Files (x86)\Adobe\Acrobat Reader DC\Reader\AcroRd32.exe",
-                r"C:\Program Files\Adobe\Acrobat Reader DC\Reader\AcroRd32.exe",
-                r"C:\Program Files (x86)\Adobe\Acrobat Reader DC\Reader\AcroRd32.exe",
-            ]
-            
-            acrobat_path = None
-            for path in acrobat_paths:
-                if Path(path).exists():
-                    acrobat_path = path
-                    break
+            # Adobe Readerのコマンドラインオプションを使用（パスは起動時に検索済み）
+            acrobat_path = ACROBAT_PATH
             
             # Adobe Readerが見つかった場合は、コマンドラインで印刷を試行
             # リコーApeos C7070の場合、プリンター設定を事前に変更する必要がある
@@ -628,74 +1494,82 @@ def print_pdf(pdf_path: Path, printer_name: str, copies: int = 1) -> bool:
                     logging.info(f"Adobe Readerを使用して印刷: {acrobat_path}")
                     
                     # 印刷前にNup設定を強制的に1に設定
+                    # （既に1であることを確認済み、または変更できないと分かっているプリンターは毎回の確認を省略）
                     original_nup_values = {}
-                    try:
-                        printer_handle = win32print.OpenPrinter(printer_name)
+                    if printer_name in _nup_checked_printers:
+                        logging.debug(f"プリンター '{printer_name}' のNup設定は確認済みのためスキップします")
+                    else:
                         try:
-                            printer_info = win32print.GetPrinter(printer_handle, 2)
-                            if printer_info and 'pDevMode' in printer_info and printer_info['pDevMode']:
-                                devmode = printer_info['pDevMode']
-                                logging.info(f"プリンター設定（現在）: PaperSize={devmode.PaperSize}, Orientation={devmode.Orientation}, Copies={devmode.Copies}")
+                            printer_handle = win32print.OpenPrinter(printer_name)
+                            try:
+                                printer_info = win32print.GetPrinter(printer_handle, 2)
+                                if printer_info and 'pDevMode' in printer_info and printer_info['pDevMode']:
+                                    devmode = printer_info['pDevMode']
+                                    logging.info(f"プリンター設定（現在）: PaperSize={devmode.PaperSize}, Orientation={devmode.Orientation}, Copies={devmode.Copies}")
                                 
-                                # リコーApeos C7070固有のNup設定を確認し、強制的に1に設定
-                                devmode_attrs = dir(devmode)
-                                nup_attrs = ['PagesPerSheet', 'PagesPerSheetN', 'Nup', 'NupOrientOrder', 'PagesPerSheetNup']
+                                    # リコーApeos C7070固有のNup設定を確認し、強制的に1に設定
+                                    devmode_attrs = dir(devmode)
+                                    nup_attrs = ['PagesPerSheet', 'PagesPerSheetN', 'Nup', 'NupOrientOrder', 'PagesPerSheetNup']
                                 
-                                needs_update = False
-                                for attr_name in nup_attrs:
-                                    if attr_name in devmode_attrs:
-                                        try:
-                                            current_value = getattr(devmode, attr_name)
-                                            logging.info(f"リコーApeos C7070: {attr_name} = {current_value} (現在の設定)")
+                                    needs_update = False
+                                    for attr_name in nup_attrs:
+                                        if attr_name in devmode_attrs:
+                                            try:
+                                                current_value = getattr(devmode, attr_name)
+                                                logging.info(f"リコーApeos C7070: {attr_name} = {current_value} (現在の設定)")
                                             
-                                            # 1以外の場合は1に強制設定が必要
-                                            if current_value != 1:
-                                                # 元の値を保存
-                                                original_nup_values[attr_name] = current_value
-                                                setattr(devmode, attr_name, 1)
-                                                logging.info(f"リコーApeos C7070: {attr_name} を {current_value} -> 1 に変更します")
-                                                needs_update = True
-                                        except Exception as e:
-                                            logging.debug(f"{attr_name} の設定をスキップ: {e}")
+                                                # 1以外の場合は1に強制設定が必要
+                                                if current_value != 1:
+                                                    # 元の値を保存
+                                                    original_nup_values[attr_name] = current_value
+                                                    setattr(devmode, attr_name, 1)
+                                                    logging.info(f"リコーApeos C7070: {attr_name} を {current_value} -> 1 に変更します")
+                                                    needs_update = True
+                                            except Exception as e:
+                                                logging.debug(f"{attr_name} の設定をスキップ: {e}")
                                 
-                                # 設定変更が必要な場合のみSetPrinterで保存を試行
-                                # ただし、権限不足の場合はスキップして印刷を継続
-                                if needs_update:
-                                    try:
-                                        # printer_infoのpDevModeを更新
-                                        printer_info['pDevMode'] = devmode
-                                        # SetPrinterで設定を保存
-                                        win32print.SetPrinter(printer_handle, 2, printer_info, 0)
-                                        logging.info(f"Nup設定を1に強制設定しました: {printer_name}")
-                                    except Exception as e:
-                                        error_code = e.args[0] if e.args else None
-                                        if error_code == 5:  # アクセス拒否
-                                            logging.info(f"SetPrinter権限不足（エラー5）: プリンター設定の変更をスキップして印刷を継続します")
-                                            logging.info(f"プリンター '{printer_name}' のNup設定は現在のまま（{original_nup_values}）で印刷されます")
-                                            # SetPrinterが失敗した場合、devmodeの変更を元に戻す（メモリ上の変更をクリア）
-                                            for attr_name, original_value in original_nup_values.items():
-                                                try:
-                                                    setattr(devmode, attr_name, original_value)
-                                                    logging.debug(f"{attr_name} を元の値 {original_value} に戻しました")
-                                                except Exception:
-                                                    pass
-                                        else:
-                                            logging.warning(f"SetPrinterで設定を保存できませんでした: {e}")
-                                            logging.warning(f"プリンター '{printer_name}' の設定を手動で1ページ/枚に設定してください")
-                                            # SetPrinterが失敗した場合、devmodeの変更を元に戻す
-                                            for attr_name, original_value in original_nup_values.items():
-                                                try:
-                                                    setattr(devmode, attr_name, original_value)
-                                                    logging.debug(f"{attr_name} を元の値 {original_value} に戻しました")
-                                                except Exception:
-                                                    pass
-                                else:
-                                    logging.info(f"プリンター '{printer_name}' のNup設定は既に1です（変更不要）")
-                        finally:
-                            win32print.ClosePrinter(printer_handle)
-                    except Exception as e:
-                        logging.warning(f"プリンター設定の変更をスキップしました: {e}")
-                        logging.warning(f"プリンター '{printer_name}' の設定を手動で1ページ/枚に設定してください")
+                                    # 設定変更が必要な場合のみSetPrinterで保存を試行
+                                    # ただし、権限不足の場合はスキップして印刷を継続
+                                    if needs_update:
+                                        try:
+                                            # printer_infoのpDevModeを更新
+                                            printer_info['pDevMode'] = devmode
+                                            # SetPrinterで設定を保存
+                                            win32print.SetPrinter(printer_handle, 2, printer_info, 0)
+                                            logging.info(f"Nup設定を1に強制設定しました: {printer_name}")
+                                            _nup_checked_printers.add(printer_name)
+                                        except Exception as e:
+                                            error_code = e.args[0] if e.args else None
+                                            if error_code == 5:  # アクセス拒否
+                                                # 権限は実行中に変わらないため、以降のジョブでは変更を試みない
+                                                _nup_checked_printers.add(printer_name)
+                                                logging.info(f"SetPrinter権限不足（エラー5）: プリンター設定の変更をスキップして印刷を継続します")
+                                                logging.info(f"プリンター '{printer_name}' のNup設定は現在のまま（{original_nup_values}）で印刷されます")
+                                                # SetPrinterが失敗した場合、devmodeの変更を元に戻す（メモリ上の変更をクリア）
+                                                for attr_name, original_value in original_nup_values.items():
+                                                    try:
+                                                        setattr(devmode, attr_name, original_value)
+                                                        logging.debug(f"{attr_name} を元の値 {original_value} に戻しました")
+                                                    except Exception:
+                                                        pass
+                                            else:
+                                                logging.warning(f"SetPrinterで設定を保存できませんでした: {e}")
+                                                logging.warning(f"プリンター '{printer_name}' の設定を手動で1ページ/枚に設定してください")
+                                                # SetPrinterが失敗した場合、devmodeの変更を元に戻す
+                                                for attr_name, original_value in original_nup_values.items():
+                                                    try:
+                                                        setattr(devmode, attr_name, original_value)
+                                                        logging.debug(f"{attr_name} を元の値 {original_value} に戻しました")
+                                                    except Exception:
+                                                        pass
+                                    else:
+                                        logging.info(f"プリンター '{printer_name}' のNup設定は既に1です（変更不要）")
+                                        _nup_checked_printers.add(printer_name)
+                            finally:
+                                win32print.ClosePrinter(printer_handle)
+                        except Exception as e:
+                            logging.warning(f"プリンター設定の変更をスキップしました: {e}")
+                            logging.warning(f"プリンター '{printer_name}' の設定を手動で1ページ/枚に設定してください")
                     
                     # Nup設定を1に強制設定した状態で印刷
                     # Adobe Readerで印刷（/t でダイアログなし）
@@ -706,29 +1580,23 @@ def print_pdf(pdf_path: Path, printer_name: str, copies: int = 1) -> bool:
                         logging.error(f"利用可能なプリンタ: {all_printers}")
                         return False
                     
+                    if copy_future is not None:
+                        copy_future.result()
+                    
                     result = win32api.ShellExecute(
                         0,
                         "open",
                         acrobat_path,
                         f'/t "{abs_path}" "{printer_name}"',
-                        str(Path(abs_path).parent),
+                        abs_parent_str,
                         0
                     )
                     
                     logging.info(f"ShellExecute戻り値: {result}")
                     if result > 32:
-                        logging.info(f"印刷ジョブを投入しました（Adobe Reader経由）: {pdf_path.name} -> {printer_name}")
+                        logging.info(f"印刷ジョブを投入しました（Adobe Reader経由）: {pdf_name} -> {printer_name}")
                         if temp_pdf_path:
-                            import threading
-                            def delete_temp_file():
-                                time.sleep(10)
-                                try:
-                                    if temp_pdf_path.exists():
-                                        temp_pdf_path.unlink()
-                                        logging.info(f"一時ファイルを削除: {temp_pdf_path}")
-                                except Exception as e:
-                                    logging.warning(f"一時ファイル削除エラー: {e}")
-                            threading.Thread(target=delete_temp_file, daemon=True).start()
+                            schedule_unlink(temp_pdf_path)
                         return True
                     else:
                         logging.error(f"ShellExecute失敗: 戻り値={result}")
@@ -739,6 +1607,9 @@ def print_pdf(pdf_path: Path, printer_name: str, copies: int = 1) -> bool:
                     
                     # 方法3: デフォルトプリンタを一時的に変更して印刷（最後の手段）
                     try:
+                        if copy_future is not None:
+                            copy_future.result()
+                        
                         # 現在のデフォルトプリンタを取得
                         default_printer = win32print.GetDefaultPrinter()
                         logging.info(f"現在のデフォルトプリンタ: {default_printer}")
@@ -753,7 +1624,7 @@ def print_pdf(pdf_path: Path, printer_name: str, copies: int = 1) -> bool:
                             "print",
                             abs_path,
                             None,  # デフォルトプリンタを使用
-                            str(Path(abs_path).parent),
+                            abs_parent_str,
                             0
                         )
                         
@@ -761,19 +1632,10 @@ def print_pdf(pdf_path: Path, printer_name: str, copies: int = 1) -> bool:
                         win32print.SetDefaultPrinter(default_printer)
                         
                         if result > 32:
-                            logging.info(f"印刷ジョブを投入しました: {pdf_path.name} -> {printer_name} (部数: {copies})")
+                            logging.info(f"印刷ジョブを投入しました: {pdf_name} -> {printer_name} (部数: {copies})")
                             # 一時ファイルを削除
                             if temp_pdf_path:
-                                import threading
-                                def delete_temp_file():
-                                    time.sleep(10)
-                                    try:
-                                        if temp_pdf_path.exists():
-                                            temp_pdf_path.unlink()
-                                            logging.info(f"一時ファイルを削除: {temp_pdf_path}")
-                                    except Exception as e:
-                                        logging.warning(f"一時ファイル削除エラー: {e}")
-                                threading.Thread(target=delete_temp_file, daemon=True).start()
+                                schedule_unlink(temp_pdf_path)
                             return True
                         else:
                             logging.error(f"印刷に失敗しました。ShellExecute戻り値: {result}")
@@ -828,6 +1690,76 @@ def print_pdf(pdf_path: Path, printer_name: str, copies: int = 1) -> bool:
         return False
 
 
+# CSVログは書き込み専用スレッドがキューから受け取ってまとめて書き込む
+# （ファイルは開いたままにし、溜まった行を1回のflushで書き出す）
+LOG_BATCH_SIZE = 64
+_log_queue = queue.Queue()
+_LOG_STOP = object()
+_log_lock = threading.Lock()
+_log_thread = None
+
+
+def _open_log_csv():
+    """CSVログを追記モードで開く（空のファイルの場合のみヘッダーを書き込む）"""
+    log_fh = open(LOG_CSV, "a", newline="", encoding="utf-8")
+    log_writer = csv.writer(log_fh)
+    # ヘッダーの要否は開いたハンドルのサイズで1回だけ判定する
+    if os.fstat(log_fh.fileno()).st_size == 0:
+        log_writer.writerow([
+            "timestamp", "scan_file", "print_id",
+            "printer", "result", "error_message"
+        ])
+    return log_fh, log_writer
+
+
+def _log_drain():
+    """キューに溜まったログ行を最大LOG_BATCH_SIZE行ずつまとめて書き込む"""
+    try:
+        log_fh, log_writer = _open_log_csv()
+    except Exception as e:
+        logging.error(f"CSVログを開けませんでした: {LOG_CSV}, {e}")
+        return
+    
+    try:
+        while True:
+            row = _log_queue.get()
+            batch = []
+            stop = False
+            while True:
+                if row is _LOG_STOP:
+                    stop = True
+                    break
+                batch.append(row)
+                if len(batch) >= LOG_BATCH_SIZE:
+                    break
+                try:
+                    row = _log_queue.get_nowait()
+                except queue.Empty:
+                    break
+            
+            if batch:
+                try:
+                    log_writer.writerows(batch)
+                    log_fh.flush()
+                except Exception as e:
+                    logging.error(f"CSVログの書き込みエラー: {e}")
+            if stop:
+                return
+    finally:
+        log_fh.close()
+
+
+def _close_log_csv():
+    """終了時に未書き込みのログを書き出してCSVログを閉じる"""
+    with _log_lock:
+        if _log_thread is not None:
+            _log_queue.put(_LOG_STOP)
+            _log_thread.join(timeout=5)
+
+
+atexit.register(_close_log_csv)
+
+
 def log_print_result(
     scan_file: str,
     print_id: Optional[str],
@@ -835,35 +1767,121 @@ def log_print_result(
     result: str,
     error_message: str = ""
 ):
-    """印刷結果をCSVログに記録"""
+    """印刷結果をCSVログに記録（書き込みは専用スレッドで行い、呼び出し元は待たない）"""
+    global _log_thread
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    # ログファイルが存在しない場合はヘッダーを書き込む
-    file_exists = LOG_CSV.exists()
-    
-    with open(LOG_CSV, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow([
-                "timestamp", "scan_file", "print_id",
-                "printer", "result", "error_message"
-            ])
-        writer.writerow([
-            timestamp, scan_file, print_id or "",
-            printer, result, error_message
-        ])
+    with _log_lock:
+        if _log_thread is None:
+            _log_thread = threading.Thread(target=_log_drain, name="csv_log", daemon=True)
+            _log_thread.start()
+    _log_queue.put([
+        timestamp, scan_file, print_id or "",
+        printer, result, error_message
+    ])
 
 
-def handle_pdf(pdf_path: Path) -> None:
-    """PDF1つの処理：安定化待ち→QR読取→印刷→ログ記録"""
-    logging.info(f"handle_pdf呼び出し: {pdf_path} (存在: {pdf_path.exists()})")
-    # 既に処理中のファイルはスキップ（二重処理防止）
-    file_key = str(pdf_path)
-    if file_key in processing_files:
-        logging.info(f"処理中のファイルをスキップ: {pdf_path}")
+# 処理済み・エラーフォルダは起動時に1回だけ作成する（実行中に消えることはない前提）
+_DIRS_READY = False
+
+
+def _ensure_dirs() -> None:
+    """PROCESSED_DIR / ERROR_DIRを作成（2回目以降は何もしない）"""
+    global _DIRS_READY
+    if _DIRS_READY:
         return
+    PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+    ERROR_DIR.mkdir(parents=True, exist_ok=True)
+    _DIRS_READY = True
+
+
+def _quarantine(path: Path, dest_dir: Path) -> Path:
+    """ファイルをdest_dirへ移動（同名ファイルがある場合はタイムスタンプを追加）
+    同一ドライブ内ならos.renameの1回で移動し、別ドライブの場合のみshutil.moveでコピー移動する"""
+    # main()を経由せずに呼ばれた場合に備えて、初回だけフォルダを作成
+    _ensure_dirs()
+    dest = dest_dir / path.name
+    # 移動後も同じファイルの再投入を判別できるよう、移動前のサイズ・更新時刻を控えておく
+    st = os.stat(path)
     
-    processing_files.add(file_key)
+    try:
+        # Windowsのos.renameは移動先が存在するとFileExistsErrorになるため、事前のexists()確認は不要
+        os.rename(path, dest)
+    except FileExistsError:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        dest = dest_dir / f"{path.stem}_{timestamp}{path.suffix}"
+        _move_file(path, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        if dest.exists():
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            dest = dest_dir / f"{path.stem}_{timestamp}{path.suffix}"
+        shutil.move(str(path), str(dest))
+    mark_recently_done(path, st)
+    return dest
+
+
+def _move_file(src: Path, dest: Path) -> Path:
+    """srcをdestへ移動（別ドライブの場合のみshutil.moveにフォールバック）"""
+    try:
+        os.rename(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(str(src), str(dest))
+    return dest
+
+
+def _move_to_error(pdf_path: Path, reason: str, print_id: Optional[str], printer_name: str) -> bool:
+    """スキャンPDFをerrorフォルダへ移動し、エラーとしてCSVログに記録"""
+    try:
+        _quarantine(pdf_path, ERROR_DIR)
+        log_print_result(
+            scan_file=pdf_path.name,
+            print_id=print_id or "unknown",
+            printer=printer_name,
+            result="error",
+            error_message=reason
+        )
+        return True
+    except Exception as e:
+        logging.error(f"errorフォルダへの移動エラー: {e}")
+        return False
+
+
+def _move_to_processed(pdf_path: Path, print_id: Optional[str], printer_name: str) -> bool:
+    """スキャンPDFをprocessedフォルダへ移動し、成功としてCSVログに記録"""
+    try:
+        _quarantine(pdf_path, PROCESSED_DIR)
+        log_print_result(
+            scan_file=pdf_path.name,
+            print_id=print_id or "unknown",
+            printer=printer_name,
+            result="success",
+            error_message=""
+        )
+        return True
+    except Exception as e:
+        logging.error(f"processedフォルダへの移動エラー: {e}")
+        return False
+
+
+def handle_pdf(pdf_path: Path, stable_count: int = STABLE_CHECK_COUNT) -> None:
+    """PDF1つの処理：安定化待ち→QR読取→印刷→ログ記録"""
+    # 存在確認のstatは1回だけ行い、安定化待ちの1回目のサイズとして再利用する
+    try:
+        initial_stat = os.stat(pdf_path)
+    except OSError:
+        initial_stat = None
+    logging.debug(f"handle_pdf呼び出し: {pdf_path} (存在: {initial_stat is not None})")
+    # 既に処理中のファイルはスキップ（二重処理防止）
+    file_key = _norm_key(pdf_path)
+    with processing_files_lock:
+        if file_key in processing_files:
+            logging.info(f"処理中のファイルをスキップ: {pdf_path}")
+            return
+        processing_files.add(file_key)
     
     try:
         # ファイルがPDFか確認
@@ -874,12 +1892,21 @@ def handle_pdf(pdf_path: Path) -> None:
         logging.info(f"PDF検出: {pdf_path}")
         
         # ファイル安定化待ち
-        if not wait_until_file_stable(pdf_path):
+        if not wait_until_file_stable(pdf_path, stable_count, initial_stat):
             logging.warning(f"ファイルが安定しませんでした: {pdf_path}")
             return
         
+        # PDFのヘッダーを確認（壊れた・不完全なファイルでpopplerを起動しない）
+        if not is_pdf_file(pdf_path):
+            if _move_to_error(pdf_path, "Invalid PDF", None, PRINTER_NAME):
+                logging.warning(f"PDFとして認識できないファイルです: {pdf_path}")
+            return
+        
+        # プリンタ一覧の取得（スプーラへの問い合わせ）をQRコード読み取りと並行して進めておく
+        printers_future = io_executor.submit(get_available_printers) if HAS_WIN32PRINT else None
+        
         # QRコードからファイル名（FILE=）とプリンター名（PRINTER=）を抽出（PRINT_IDはログ用にのみ使用）
-        print_id, original_filename, qr_printer_name = extract_print_id_from_qr(pdf_path)
+        print_id, original_filename, qr_printer_name = extract_print_id_in_pool(pdf_path)
         
         # プリンター名の決定: QRコードに含まれていればそれを使用、なければデフォルト値
         if qr_printer_name:
@@ -891,28 +1918,8 @@ def handle_pdf(pdf_path: Path) -> None:
         
         if not original_filename:
             # FILE=が含まれていない場合、errorフォルダへ
-            ERROR_DIR.mkdir(parents=True, exist_ok=True)
-            error_file = ERROR_DIR / pdf_path.name
-            
-            # 同名ファイルがある場合はタイムスタンプを追加
-            if error_file.exists():
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                stem = error_file.stem
-                suffix = error_file.suffix
-                error_file = ERROR_DIR / f"{stem}_{timestamp}{suffix}"
-            
-            try:
-                shutil.move(str(pdf_path), str(error_file))
-                log_print_result(
-                    scan_file=pdf_path.name,
-                    print_id=print_id or "unknown",
-                    printer=printer_name,
-                    result="error",
-                    error_message="FILE not found in QR"
-                )
+            if _move_to_error(pdf_path, "FILE not found in QR", print_id, printer_name):
                 logging.warning(f"QRコードにFILE=が含まれていません: {pdf_path}")
-            except Exception as e:
-                logging.error(f"errorフォルダへの移動エラー: {e}")
             return
         
         # ファイル名で印刷対象PDFを取得
@@ -921,100 +1928,39 @@ def handle_pdf(pdf_path: Path) -> None:
         
         if not print_pdf_path:
             # 印刷対象PDFが見つからない場合、errorフォルダへ
-            ERROR_DIR.mkdir(parents=True, exist_ok=True)
-            error_file = ERROR_DIR / pdf_path.name
-            
-            # 同名ファイルがある場合はタイムスタンプを追加
-            if error_file.exists():
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                stem = error_file.stem
-                suffix = error_file.suffix
-                error_file = ERROR_DIR / f"{stem}_{timestamp}{suffix}"
-            
-            try:
-                shutil.move(str(pdf_path), str(error_file))
-                log_print_result(
-                    scan_file=pdf_path.name,
-                    print_id=print_id or "unknown",
-                    printer=printer_name,
-                    result="error",
-                    error_message=f"PDF not found: {original_filename}"
-                )
+            if _move_to_error(pdf_path, f"PDF not found: {original_filename}", print_id, printer_name):
                 logging.error(f"印刷対象PDFが見つかりません: {original_filename}")
-            except Exception as e:
-                logging.error(f"errorフォルダへの移動エラー: {e}")
             return
         
         # 印刷対象PDFを印刷（部数は1部固定）
-        print_success = print_pdf(print_pdf_path, printer_name, 1)
+        known_printers = None
+        if printers_future is not None:
+            try:
+                known_printers = printers_future.result()
+            except Exception as e:
+                logging.warning(f"プリンタ一覧の事前取得に失敗しました: {e}")
+        print_success = print_pdf(print_pdf_path, printer_name, 1, known_printers)
         
         if print_success:
             # 成功時、processedフォルダへ移動
-            PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
-            processed_file = PROCESSED_DIR / pdf_path.name
-            
-            # 同名ファイルがある場合はタイムスタンプを追加
-            if processed_file.exists():
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                stem = processed_file.stem
-                suffix = processed_file.suffix
-                processed_file = PROCESSED_DIR / f"{stem}_{timestamp}{suffix}"
-            
-            try:
-                shutil.move(str(pdf_path), str(processed_file))
-                log_print_result(
-                    scan_file=pdf_path.name,
-                    print_id=print_id or "unknown",
-                    printer=printer_name,
-                    result="success",
-                    error_message=""
-                )
+            if _move_to_processed(pdf_path, print_id, printer_name):
                 logging.info(f"処理完了: {pdf_path.name} -> {original_filename} (PRINT_ID: {print_id or 'N/A'})")
-            except Exception as e:
-                logging.error(f"processedフォルダへの移動エラー: {e}")
         else:
             # 印刷失敗時、errorフォルダへ
-            ERROR_DIR.mkdir(parents=True, exist_ok=True)
-            error_file = ERROR_DIR / pdf_path.name
-            
-            # 同名ファイルがある場合はタイムスタンプを追加
-            if error_file.exists():
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                stem = error_file.stem
-                suffix = error_file.suffix
-                error_file = ERROR_DIR / f"{stem}_{timestamp}{suffix}"
-            
-            try:
-                shutil.move(str(pdf_path), str(error_file))
-                log_print_result(
-                    scan_file=pdf_path.name,
-                    print_id=print_id or "unknown",
-                    printer=printer_name,
-                    result="error",
-                    error_message="Print failed"
-                )
-            except Exception as e:
-                logging.error(f"errorフォルダへの移動エラー: {e}")
+            _move_to_error(pdf_path, "Print failed", print_id, printer_name)
     
     except Exception as e:
         logging.exception(f"処理エラー: {pdf_path}, {e}")
-        # エラー時もerrorフォルダへ移動を試みる
+        # エラー時もerrorフォルダへ移動を試みる（既に無い場合は移動時のエラーで判定し、事前のstatは行わない）
         try:
-            ERROR_DIR.mkdir(parents=True, exist_ok=True)
-            error_file = ERROR_DIR / pdf_path.name
-            
-            if pdf_path.exists():
-                if error_file.exists():
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    stem = error_file.stem
-                    suffix = error_file.suffix
-                    error_file = ERROR_DIR / f"{stem}_{timestamp}{suffix}"
-                shutil.move(str(pdf_path), str(error_file))
+            _quarantine(pdf_path, ERROR_DIR)
         except Exception:
             pass
     finally:
         # 処理中リストから削除
-        processing_files.discard(file_key)
+        with processing_files_lock:
+            processing_files.discard(file_key)
+        last_write_events.pop(file_key, None)
 
 
 # ==========================
@@ -1025,34 +1971,62 @@ class PDFHandler(FileSystemEventHandler):
         if event.is_directory:
             return
         path = Path(event.src_path)
-        logging.info(f"ファイル検出イベント: {path} (拡張子: {path.suffix})")
+        logging.debug(f"ファイル検出イベント: {path} (拡張子: {path.suffix})")
         if path.suffix.lower() == ".pdf":
             logging.info(f"PDFファイルを検出しました: {path}")
-            # 処理は別スレッドで実行（非ブロッキング）
-            import threading
-            threading.Thread(target=self._handle_pdf_delayed, args=(path,), daemon=True).start()
+            record_write_event(path)
+            self._schedule(path)
         else:
             logging.debug(f"PDF以外のファイルをスキップ: {path}")
     
-    def _handle_pdf_delayed(self, path: Path):
-        """少し待ってから処理（ファイル作成完了を待つ）"""
+    def _schedule(self, path: Path, stable_count: int = STABLE_CHECK_COUNT, delay: float = EVENT_DEBOUNCE_SEC):
+        """同じパスのイベントをまとめ、最後のイベントからdelay秒後に1回だけ処理を投入"""
+        key = _norm_key(path)
+        with _pending_timers_lock:
+            pending = _pending_timers.get(key)
+            if pending is not None:
+                timer, pending_stable_count = pending
+                timer.cancel()
+                # リネームイベントを含む場合は短縮した安定化チェックを引き継ぐ
+                stable_count = min(stable_count, pending_stable_count)
+            timer = threading.Timer(delay, self._submit, args=(path, stable_count))
+            timer.daemon = True
+            _pending_timers[key] = (timer, stable_count)
+            timer.start()
+    
+    def _submit(self, path: Path, stable_count: int):
+        """タイマー満了時に処理をワーカースレッドへ投入（非ブロッキング）"""
+        with _pending_timers_lock:
+            _pending_timers.pop(_norm_key(path), None)
+        try:
+            st = os.stat(path)
+        except OSError:
+            logging.debug(f"ファイルが既に存在しないためスキップ: {path}")
+            return
+        if is_recently_done(path, st):
+            # 移動直前のイベントの残りなら次の確認時には消えている。残っていれば改めて処理する
+            logging.debug(f"処理済みのファイルと同一のため{RECENTLY_DONE_SEC}秒後に再確認: {path}")
+            self._schedule(path, stable_count, RECENTLY_DONE_SEC)
+            return
+        if not should_dispatch(path):
+            logging.debug(f"直前に投入済みのためスキップ: {path}")
+            return
         logging.info(f"PDF処理を開始: {path}")
-        time.sleep(0.3)
-        handle_pdf(path)
+        pdf_executor.submit(handle_pdf, path, stable_count)
     
     def on_modified(self, event):
         """ファイル変更イベント（ネットワークドライブでon_createdが発火しない場合の対策）"""
         if event.is_directory:
             return
         path = Path(event.src_path)
-        logging.info(f"ファイル変更イベント: {path} (拡張子: {path.suffix})")
+        logging.debug(f"ファイル変更イベント: {path} (拡張子: {path.suffix})")
         if path.suffix.lower() == ".pdf":
+            record_write_event(path)
             # ファイルサイズが0でない場合のみ処理（作成中はスキップ）
             try:
                 if path.exists() and path.stat().st_size > 0:
-                    logging.info(f"PDFファイル変更を検出しました: {path}")
-                    import threading
-                    threading.Thread(target=self._handle_pdf_delayed, args=(path,), daemon=True).start()
+                    logging.debug(f"PDFファイル変更を検出しました: {path}")
+                    self._schedule(path)
             except Exception as e:
                 logging.debug(f"ファイル変更イベント処理エラー: {e}")
     
@@ -1060,14 +2034,49 @@ class PDFHandler(FileSystemEventHandler):
         if event.is_directory:
             return
         path = Path(event.dest_path)
-        logging.info(f"ファイル移動イベント: {path}")
+        logging.debug(f"ファイル移動イベント: {path}")
         if path.suffix.lower() == ".pdf":
-            import threading
-            threading.Thread(target=self._handle_pdf_delayed, args=(path,), daemon=True).start()
+            # リネームで置かれたファイルは書き込み済みのため、安定化チェックを短縮
+            self._schedule(path, STABLE_CHECK_COUNT_MOVED)
+
+
+def sweep_scan_dir(handler: PDFHandler) -> None:
+    """監視フォルダに残っているPDFのうち、処理中・イベント待ちでなく直近DISPATCH_HISTORY_SEC以内に
+    投入していないものを処理待ちに入れ直す（デバウンスや重複判定で捨てられたイベントの取りこぼし対策）"""
+    try:
+        with os.scandir(SCAN_DIR) as it:
+            entries = [entry for entry in it if entry.name.lower().endswith(".pdf")]
+    except OSError as e:
+        logging.debug(f"フォルダ走査エラー: {e}")
+        return
+    
+    for entry in entries:
+        file_key = _norm_key(entry.path)
+        with processing_files_lock:
+            if file_key in processing_files:
+                continue
+        with _pending_timers_lock:
+            if file_key in _pending_timers:
+                continue
+        with _dispatched_lock:
+            if file_key in _dispatched:
+                continue
+        try:
+            # DirEntryのキャッシュ済みstatを使い、エントリごとのstat呼び出しを1回にする
+            if not entry.is_file() or entry.stat().st_size <= 0:
+                continue
+        except OSError:
+            continue
+        logging.info(f"フォルダ走査で未処理のPDFを検出: {entry.path}")
+        handler._schedule(Path(entry.path))
 
 
 def main():
     """メイン処理"""
+    global qr_pool, pdf_executor, _observer_event_interval
+    
+    setup_logging()
+    
     try:
         logging.info("四谷校用QRスキャン自動印刷システム（実験版）を起動します")
         print("=" * 60)
@@ -1086,13 +2095,13 @@ def main():
         
         print(f"✓ 監視フォルダ: {SCAN_DIR}")
         
-        if not HAS_PDF2IMAGE:
-            error_msg = "pdf2imageがインストールされていません: pip install pdf2image"
+        if not HAS_FITZ and not HAS_PDF2IMAGE:
+            error_msg = "PyMuPDFまたはpdf2imageがインストールされていません: pip install pymupdf"
             logging.error(error_msg)
             print(f"ERROR: {error_msg}")
             input("\nEnterキーを押して終了してください...")
             return
-        print("✓ pdf2image: OK")
+        print("✓ PDFレンダリング: " + ("PyMuPDF" if HAS_FITZ else "pdf2image"))
         
         if not HAS_PYZBAR:
             logging.warning("pyzbarがインストールされていません: pip install pyzbar pillow (QRコード読み取りができません)")
@@ -1109,8 +2118,7 @@ def main():
         print("✓ pywin32: OK")
     
         # フォルダを作成
-        PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
-        ERROR_DIR.mkdir(parents=True, exist_ok=True)
+        _ensure_dirs()
         
         logging.info(f"監視フォルダ: {SCAN_DIR}")
         logging.info(f"処理済みフォルダ: {PROCESSED_DIR}")
@@ -1130,9 +2138,7 @@ def main():
         
         # プリンタの存在確認
         try:
-            printers = [printer[2] for printer in win32print.EnumPrinters(win32print.PRINTER_ENUM_LOCAL)]
-            printers_network = [printer[2] for printer in win32print.EnumPrinters(win32print.PRINTER_ENUM_NETWORK)]
-            all_printers = printers + printers_network
+            all_printers = get_available_printers()
             
             if PRINTER_NAME not in all_printers:
                 print(f"\nWARNING: プリンタ '{PRINTER_NAME}' が見つかりませんでした。")
@@ -1151,66 +2157,63 @@ def main():
         print("停止するには Ctrl+C を押してください。")
         print("=" * 60 + "\n")
         
+        # QRコード読み取り用のワーカープールを起動
+        try:
+            qr_pool = multiprocessing.Pool(processes=QR_WORKER_PROCESSES, initializer=_init_qr_worker, initargs=(log_queue,))
+            logging.info(f"QR読み取りワーカーを起動しました: {QR_WORKER_PROCESSES}プロセス")
+        except Exception as e:
+            qr_pool = None
+            logging.warning(f"QR読み取りワーカーを起動できませんでした（メインプロセスで処理します）: {e}")
+        
+        pdf_executor = ThreadPoolExecutor(max_workers=PDF_WORKER_THREADS, thread_name_prefix="pdf_worker")
+        
         # 監視開始
-        observer = Observer()
-        observer.schedule(PDFHandler(), str(SCAN_DIR), recursive=False)
+        # ネットワークドライブではファイルシステムの変更通知が届かないことがあるため、
+        # watchdogのPollingObserverでフォルダを定期的に走査する（ローカルドライブは通常のObserverのみ）
+        if is_network_path(SCAN_DIR):
+            observer = PollingObserver(timeout=POLL_INTERVAL_SEC)
+            _observer_event_interval = POLL_INTERVAL_SEC
+            logging.info(f"ネットワークドライブのためポーリングで監視します（{POLL_INTERVAL_SEC}秒間隔）")
+        else:
+            observer = Observer()
+        handler = PDFHandler()
+        observer.schedule(handler, str(SCAN_DIR), recursive=False)
         observer.start()
         logging.info("フォルダ監視を開始しました")
         
-        # 定期的なポーリング（ネットワークドライブ対策）
-        last_poll_time = time.time()
-        poll_interval = 2.0  # 2秒ごとにポーリング
-        
-        def poll_for_new_pdfs():
-            """フォルダ内のPDFファイルを定期的にチェック"""
-            try:
-                if not SCAN_DIR.exists():
-                    return
-                for pdf_file in SCAN_DIR.glob("*.pdf"):
-                    # 処理済みフォルダやエラーフォルダのファイルはスキップ
-                    if pdf_file.parent == PROCESSED_DIR or pdf_file.parent == ERROR_DIR:
-                        continue
-                    # 処理中のファイルはスキップ
-                    file_key = str(pdf_file)
-                    if file_key in processing_files:
-                        continue
-                    # ファイルサイズが0でない場合のみ処理
-                    try:
-                        if pdf_file.exists() and pdf_file.stat().st_size > 0:
-                            # ファイルの最終更新時刻をチェック（最近変更されたファイルのみ）
-                            mtime = pdf_file.stat().st_mtime
-                            if time.time() - mtime < 10:  # 10秒以内に変更されたファイル
-                                logging.info(f"ポーリングでPDFを検出: {pdf_file}")
-                                import threading
-                                threading.Thread(target=handle_pdf, args=(pdf_file,), daemon=True).start()
-                    except Exception as e:
-                        logging.debug(f"ポーリング処理エラー ({pdf_file}): {e}")
-            except Exception as e:
-                logging.debug(f"ポーリングエラー: {e}")
-        
         try:
-            while True:
-                current_time = time.time()
-                # 定期的にポーリング
-                if current_time - last_poll_time >= poll_interval:
-                    poll_for_new_pdfs()
-                    last_poll_time = current_time
-                time.sleep(0.5)  # 0.5秒ごとにチェック
+            # 停止要求を待ちながら、投入記録の整理と取りこぼしたPDFの走査を定期的に行う
+            next_sweep = time.monotonic() + SWEEP_INTERVAL_SEC
+            while not _shutdown.is_set():
+                prune_dispatch_history()
+                if time.monotonic() >= next_sweep:
+                    sweep_scan_dir(handler)
+                    next_sweep = time.monotonic() + SWEEP_INTERVAL_SEC
+                _shutdown.wait(POLL_INTERVAL_SEC)
         except KeyboardInterrupt:
+            _shutdown.set()
             print("\n停止中...")
             logging.info("停止中...")
             observer.stop()
         
         observer.join()
+        # まとめ待ちのイベントを破棄してからワーカーを停止
+        with _pending_timers_lock:
+            for timer, _ in _pending_timers.values():
+                timer.cancel()
+            _pending_timers.clear()
+        pdf_executor.shutdown(wait=True)
+        io_executor.shutdown(wait=True)
+        if qr_pool is not None:
+            qr_pool.terminate()
+            qr_pool.join()
         print("プログラムを終了しました。")
         
     except Exception as e:
-        import traceback
         error_msg = f"予期しないエラーが発生しました: {e}"
+        # logging.exceptionがコンソールにもトレースバックを出力する
         logging.exception(error_msg)
         print(f"\nERROR: {error_msg}")
-        print("\n詳細:")
-        traceback.print_exc()
         input("\nEnterキーを押して終了してください...")
 
 
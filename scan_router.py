@@ -1,8 +1,17 @@
 import os
 import re
+import errno
 import time
 import shutil
+import queue
+import atexit
+import struct
+import uuid
+import functools
 import logging
+import logging.handlers
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Tuple
@@ -15,10 +24,19 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
 try:
-    import win32com.client
-    HAS_WIN32COM = True
+    from pyzbar.pyzbar import decode as pyzbar_decode, ZBarSymbol
+    HAS_PYZBAR = True
+    QR_SYMBOLS = [ZBarSymbol.QRCODE]
 except ImportError:
-    HAS_WIN32COM = False
+    # 警告はログ設定後にmain()で出す（ここでloggingを呼ぶとルートロガーに既定のハンドラーが追加される）
+    HAS_PYZBAR = False
+
+try:
+    import win32file
+    import pywintypes
+    HAS_WIN32FILE = True
+except ImportError:
+    HAS_WIN32FILE = False
 
 
 # ==========================
@@ -44,6 +62,26 @@ TARGET_EXT = ".pdf"
 # 「コピー中の未完成PDF」を避けるための待機
 STABLE_CHECK_INTERVAL_SEC = 0.5
 STABLE_CHECK_COUNT = 6  # 0.5秒×6回=3秒間サイズ変化なしで安定扱い
+# 書き込み側がファイルを閉じたかを確認する間隔（Windowsのみ。閉じていればサイズの安定を待たない）
+WRITE_PROBE_INTERVAL_SEC = 0.1
+
+# PDF処理用のワーカースレッド（複合機からまとめてスキャンされた場合に並列で処理する）
+PDF_WORKER_THREADS = 4
+pdf_executor = ThreadPoolExecutor(max_workers=PDF_WORKER_THREADS, thread_name_prefix="pdf_worker")
+
+# 処理中のファイル（作成・移動イベントが重複した場合の二重処理防止）
+processing_files = set()
+processing_files_lock = threading.Lock()
+
+# 移動先の決定（同名ファイルの連番付け）から移動完了までを排他する
+_destination_lock = threading.Lock()
+
+# QRコードが貼られている領域（用紙左下。ページの幅・高さに対する割合）とそのレンダリング倍率
+QR_CLIP_WIDTH_RATIO = 0.4
+QR_CLIP_HEIGHT_RATIO = 0.4
+QR_CLIP_ZOOM = 2.5
+# 左下の領域で読めなかった場合にページ全体をレンダリングする倍率（低倍率から順に試す）
+QR_RENDER_ZOOMS = (1.3, 2.5)
 
 
 # ==========================
@@ -52,21 +90,122 @@ STABLE_CHECK_COUNT = 6  # 0.5秒×6回=3秒間サイズ変化なしで安定扱
 # 先にログフォルダを作成しておく（例: C:\Scan\）
 LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_PATH, encoding="utf-8"),
-        logging.StreamHandler()
-    ],
+# ファイル・コンソールへの出力は専用スレッド（QueueListener）で行い、
+# PDF処理中のスレッドがディスク書き込みを待たないようにする
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(
+    log_queue,
+    logging.FileHandler(LOG_PATH, encoding="utf-8"),
+    logging.StreamHandler(),
 )
+for _handler in log_listener.handlers:
+    _handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
+root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+log_listener.start()
+atexit.register(log_listener.stop)
 
 
 # ==========================
 # ユーティリティ
 # ==========================
+# .lnkファイル（MS-SHLLINK）の構造
+LNK_HEADER_SIZE = 0x4C
+LNK_HAS_TARGET_ID_LIST = 0x01
+LNK_HAS_LINK_INFO = 0x02
+LNK_INFO_VOLUME_ID_AND_LOCAL_BASE_PATH = 0x01
+LNK_INFO_COMMON_NETWORK_RELATIVE_LINK = 0x02
+# Unicode版のパスが含まれない古い形式の.lnkで使われる文字コード
+LNK_ANSI_ENCODING = "mbcs" if os.name == "nt" else "cp932"
+
+
+def _read_lnk_string(data: bytes, offset: int, unicode: bool) -> str:
+    """NUL終端の文字列を読み取る（unicode=TrueはUTF-16LE）"""
+    if unicode:
+        end = offset
+        while end + 1 < len(data) and data[end:end + 2] != b"\x00\x00":
+            end += 2
+        return data[offset:end].decode("utf-16-le")
+    end = data.index(b"\x00", offset)
+    return data[offset:end].decode(LNK_ANSI_ENCODING)
+
+
+def parse_lnk_target(shortcut_path: Path) -> Optional[str]:
+    """.lnkファイルを直接読み取り、LinkInfoからリンク先のパスを取得（COMを使わない）
+    ローカルパス（LocalBasePath）またはネットワークパス（NetName）を返す。取得できない場合はNone"""
+    data = shortcut_path.read_bytes()
+    if len(data) < LNK_HEADER_SIZE or struct.unpack_from("<I", data, 0)[0] != LNK_HEADER_SIZE:
+        return None
+    link_flags = struct.unpack_from("<I", data, 0x14)[0]
+    if not link_flags & LNK_HAS_LINK_INFO:
+        return None
+    
+    pos = LNK_HEADER_SIZE
+    if link_flags & LNK_HAS_TARGET_ID_LIST:
+        id_list_size = struct.unpack_from("<H", data, pos)[0]
+        pos += 2 + id_list_size
+    
+    (_info_size, info_header_size, info_flags, _volume_id_offset,
+     local_base_path_offset, network_link_offset, path_suffix_offset) = struct.unpack_from("<7I", data, pos)
+    
+    # LinkInfoHeaderSizeが0x24以上ならUnicode版のオフセットがある
+    local_base_path_offset_u = path_suffix_offset_u = 0
+    if info_header_size >= 0x24:
+        local_base_path_offset_u, path_suffix_offset_u = struct.unpack_from("<2I", data, pos + 0x1C)
+    
+    if path_suffix_offset_u:
+        path_suffix = _read_lnk_string(data, pos + path_suffix_offset_u, True)
+    elif path_suffix_offset:
+        path_suffix = _read_lnk_string(data, pos + path_suffix_offset, False)
+    else:
+        path_suffix = ""
+    
+    if info_flags & LNK_INFO_VOLUME_ID_AND_LOCAL_BASE_PATH:
+        if local_base_path_offset_u:
+            base_path = _read_lnk_string(data, pos + local_base_path_offset_u, True)
+        else:
+            base_path = _read_lnk_string(data, pos + local_base_path_offset, False)
+        return base_path + path_suffix
+    
+    if info_flags & LNK_INFO_COMMON_NETWORK_RELATIVE_LINK:
+        link_pos = pos + network_link_offset
+        net_name_offset = struct.unpack_from("<I", data, link_pos + 0x08)[0]
+        if net_name_offset > 0x14:
+            net_name_offset_u = struct.unpack_from("<I", data, link_pos + 0x14)[0]
+            net_name = _read_lnk_string(data, link_pos + net_name_offset_u, True)
+        else:
+            net_name = _read_lnk_string(data, link_pos + net_name_offset, False)
+        return f"{net_name}\\{path_suffix}" if path_suffix else net_name
+    
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def _get_wscript_shell():
+    """WScript.ShellのCOMオブジェクトを取得（win32comは.lnkの直接解析に失敗した場合のみ読み込む）"""
+    try:
+        import win32com.client
+    except ImportError:
+        logging.warning("win32com not available. Install pywin32: pip install pywin32")
+        return None
+    return win32com.client.Dispatch("WScript.Shell")
+
+
+def _resolve_shortcut_com(shortcut_path: Path) -> Optional[Path]:
+    """WScript.Shell（COM）でショートカットのリンク先を取得"""
+    shell = _get_wscript_shell()
+    if shell is None:
+        return None
+    
+    shortcut = shell.CreateShortCut(str(shortcut_path))
+    return Path(shortcut.TargetPath)
+
+
 def resolve_shortcut(shortcut_path: Path) -> Optional[Path]:
-    """Windowsショートカット（.lnk）の実パスを解決"""
+    """Windowsショートカット（.lnk）の実パスを解決
+    .lnkファイルを直接解析し、解析できない場合のみCOM（WScript.Shell）で解決する"""
     if not shortcut_path.exists():
         return None
     
@@ -74,14 +213,20 @@ def resolve_shortcut(shortcut_path: Path) -> Optional[Path]:
         # ショートカットでない場合はそのまま返す
         return shortcut_path if shortcut_path.is_dir() else None
     
-    if not HAS_WIN32COM:
-        logging.warning("win32com not available. Install pywin32: pip install pywin32")
-        return None
-    
     try:
-        shell = win32com.client.Dispatch("WScript.Shell")
-        shortcut = shell.CreateShortCut(str(shortcut_path))
-        target_path = Path(shortcut.TargetPath)
+        target = None
+        try:
+            target = parse_lnk_target(shortcut_path)
+        except (struct.error, ValueError, UnicodeDecodeError) as e:
+            logging.debug(f"Failed to parse shortcut {shortcut_path}, falling back to COM: {e}")
+        
+        if target:
+            target_path = Path(target)
+        else:
+            target_path = _resolve_shortcut_com(shortcut_path)
+            if target_path is None:
+                return None
+        
         if target_path.is_dir():
             return target_path
         else:
@@ -92,63 +237,131 @@ def resolve_shortcut(shortcut_path: Path) -> Optional[Path]:
         return None
 
 
+# ファイル名に使えない文字（連続する場合はまとめて1つの「_」にする）と空白の連続
+INVALID_FILENAME_CHARS_PATTERN = re.compile(r'[\\/:*?"<>|]+')
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# テンプレート自体に使えない文字がないこと（各項目だけを整形すればファイル名全体の整形は不要）
+assert not INVALID_FILENAME_CHARS_PATTERN.search(FNAME_TEMPLATE.format(date="", student="", suffix=STUDENT_SUFFIX, teacher=""))
+
+
 def sanitize_filename_part(s: str) -> str:
     """WindowsでNGな文字を除去・整形"""
-    s = s.strip()
-    s = re.sub(r'[\\/:*?"<>|]+', "_", s)
-    s = re.sub(r"\s+", " ", s)
-    return s
+    return WHITESPACE_PATTERN.sub(" ", INVALID_FILENAME_CHARS_PATTERN.sub("_", s.strip()))
+
+
+def is_write_closed(path: Path) -> bool:
+    """共有なしで開けるか（=書き込み側がファイルを閉じたか）を確認（Windowsのみ）"""
+    try:
+        handle = win32file.CreateFile(
+            str(path), win32file.GENERIC_READ, 0, None, win32file.OPEN_EXISTING, 0, None
+        )
+    except pywintypes.error:
+        # 共有違反（書き込み中）・ファイルなしなど
+        return False
+    handle.Close()
+    return True
 
 
 def wait_until_file_stable(path: Path) -> bool:
-    """書き込み中ファイルを避けるため、サイズが一定になるまで待つ"""
+    """書き込み中ファイルを避けるため、書き込みが終わるまで待つ
+    Windowsでは書き込み側がファイルを閉じた時点で完了とし、
+    それ以外（または閉じたことを確認できない場合）はサイズが一定時間変わらなければ完了とする"""
+    interval = WRITE_PROBE_INTERVAL_SEC if HAS_WIN32FILE else STABLE_CHECK_INTERVAL_SEC
+    stable_sec = STABLE_CHECK_INTERVAL_SEC * STABLE_CHECK_COUNT
+    deadline = time.monotonic() + stable_sec * 5
     last = -1
-    stable = 0
-    for _ in range(STABLE_CHECK_COUNT * 5):
+    last_change = time.monotonic()
+    while time.monotonic() < deadline:
         try:
             size = path.stat().st_size
         except FileNotFoundError:
             return False
 
-        if size == last and size > 0:
-            stable += 1
-            if stable >= STABLE_CHECK_COUNT:
-                return True
-        else:
-            stable = 0
+        now = time.monotonic()
+        if size != last:
             last = size
+            last_change = now
+        elif size > 0 and now - last_change >= stable_sec:
+            return True
 
-        time.sleep(STABLE_CHECK_INTERVAL_SEC)
+        if size > 0 and HAS_WIN32FILE and is_write_closed(path):
+            return True
+
+        time.sleep(interval)
 
     return False
 
 
-def render_first_page_to_image(pdf_path: Path, zoom: float = 3.0) -> np.ndarray:
-    """PDFの1ページ目を画像化（OpenCV BGR）"""
-    doc = fitz.open(pdf_path)
-    if doc.page_count < 1:
-        doc.close()
-        raise ValueError("PDF has no pages")
+@functools.lru_cache(maxsize=8)
+def _zoom_matrix(zoom: float) -> fitz.Matrix:
+    """倍率ごとの変換行列（使う倍率は数種類のため、生成したものを使い回す）"""
+    return fitz.Matrix(zoom, zoom)
+
+
+def render_page_to_image(page: fitz.Page, zoom: float, clip: Optional[fitz.Rect] = None) -> np.ndarray:
+    """ページを画像化（グレースケール。QR読み取りにはカラー情報が不要なため）
+    clipを指定した場合はその範囲だけをレンダリングする"""
+    # PyMuPDFで直接グレースケールにレンダリング（RGBの3分の1のサイズで、色変換も不要）
+    pix = page.get_pixmap(matrix=_zoom_matrix(zoom), clip=clip, alpha=False, colorspace=fitz.csGRAY)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+
+
+def read_qr_from_pdf(pdf_path: Path) -> Optional[str]:
+    """PDFの1ページ目からQRコードを読み取る
+    まず左下のQR領域だけをレンダリングして試し、読めなかった場合のみページ全体をレンダリングする"""
+    # fitz.open(ファイルパス)は必要な部分だけをファイルから読むため、全体をメモリへ読み込まない
+    # （例外時もファイルを開いたままにしないようwithで閉じる。再レンダリング時も開き直さない）
+    with fitz.open(pdf_path) as doc:
+        if doc.page_count < 1:
+            raise ValueError("PDF has no pages")
+
+        page = doc.load_page(0)
+        rect = page.rect
+        clip = fitz.Rect(
+            rect.x0,
+            rect.y1 - rect.height * QR_CLIP_HEIGHT_RATIO,
+            rect.x0 + rect.width * QR_CLIP_WIDTH_RATIO,
+            rect.y1,
+        )
+        qr = decode_qr_from_image(render_page_to_image(page, QR_CLIP_ZOOM, clip), "roi")
+        if qr:
+            return qr
+
+        for zoom in QR_RENDER_ZOOMS:
+            logging.debug(f"QR not found in clip, trying full page at zoom={zoom}: {pdf_path}")
+            qr = decode_qr_from_image(render_page_to_image(page, zoom), "full", upscale=False)
+            if qr:
+                return qr
+
+    return None
+
+
+# OpenCVのQRコード検出器（スレッドごとに1つ生成して使い回す）
+# ArUcoベースのファインダーパターン検出（OpenCV 4.8以降）の方が検出率が高いため優先して使う
+QR_DETECTOR_CLASS = getattr(cv2, "QRCodeDetectorAruco", cv2.QRCodeDetector)
+_qr_detector_local = threading.local()
 
-    page = doc.load_page(0)
-    mat = fitz.Matrix(zoom, zoom)
-    pix = page.get_pixmap(matrix=mat, alpha=False)
-    doc.close()
 
-    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
-    img_bgr = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-    return img_bgr
+def get_qr_detector():
+    """このスレッド用のQRコード検出器を取得"""
+    detector = getattr(_qr_detector_local, "detector", None)
+    if detector is None:
+        detector = QR_DETECTOR_CLASS()
+        _qr_detector_local.detector = detector
+    return detector
 
 
-def decode_qr_from_image(img_bgr: np.ndarray) -> Optional[str]:
+def decode_qr_from_image(img_gray: np.ndarray, label: str = "img", upscale: bool = True) -> Optional[str]:
     """
     OpenCVでQRコードを検出＆デコード
 
-    - 用紙左下にQRがある前提で、その周辺を優先的にトライ
-    - コントラストが低い場合に備えて、二値化・拡大など複数パターンを試す
+    - pyzbarがあれば先に試し、読めなかった場合のみOpenCVで検出
+    - 前処理の軽いパターンから順に試し、読めた時点で終了する
+    - upscale=Falseの場合はOtsu二値化と拡大のパターンを省略する（ページ全体の画像など大きい画像用）
     """
 
-    def _try_decode(detector: cv2.QRCodeDetector, img: np.ndarray, label: str) -> Optional[str]:
+    def _try_decode(detector, img: np.ndarray, label: str) -> Optional[str]:
         try:
             data, _, _ = detector.detectAndDecode(img)
             data = (data or "").strip()
@@ -159,42 +372,60 @@ def decode_qr_from_image(img_bgr: np.ndarray) -> Optional[str]:
             logging.debug(f"QR decode failed ({label}): {e}")
             return None
 
-    detector = cv2.QRCodeDetector()
-    h, w = img_bgr.shape[:2]
-
-    # 1) まず左下の広めのROIを試す（高さ下側40%、左側40%）
-    roi = img_bgr[int(h * 0.6): h, 0: int(w * 0.4)]
-    if roi.size > 0:
-        # 1-1) ROIそのまま
-        data = _try_decode(detector, roi, "roi_raw")
-        if data:
-            return data
-
-        # 1-2) ROIを拡大
-        roi_big = cv2.resize(roi, None, fx=2.0, fy=2.0, interpolation=cv2.INTER_CUBIC)
-        data = _try_decode(detector, roi_big, "roi_big")
-        if data:
-            return data
+    if img_gray.size == 0:
+        return None
 
-        # 1-3) ROI → グレースケール＋二値化（背景がザラザラなとき用）
-        gray = cv2.cvtColor(roi_big, cv2.COLOR_BGR2GRAY)
-        # Otsu閾値で二値化
-        _, th = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        data = _try_decode(detector, th, "roi_big_otsu")
+    # ZBar（pyzbar）はグレースケール画像を1回で読み取れ、低コントラストにも強いため最初に試す
+    if HAS_PYZBAR:
+        try:
+            codes = pyzbar_decode(img_gray, symbols=QR_SYMBOLS)
+        except Exception as e:
+            logging.debug(f"QR decode failed (zbar_{label}): {e}")
+            codes = []
+        for code in codes:
+            data = code.data.decode("utf-8", errors="replace").strip()
+            if data:
+                logging.info(f"QR decoded (zbar_{label}): '{data}'")
+                return data
+
+    # 読めなかった場合はOpenCVで前処理のパターンを変えながら試す
+    detector = get_qr_detector()
+    # 前処理の結果は複数の試行で使い回す（必要になった時点で1回だけ計算）
+    cache = {}
+
+    def _big():
+        if "big" not in cache:
+            cache["big"] = cv2.resize(img_gray, None, fx=2.0, fy=2.0, interpolation=cv2.INTER_LINEAR)
+        return cache["big"]
+
+    def _otsu(img: np.ndarray) -> np.ndarray:
+        # Otsu閾値で二値化（背景がザラザラなとき用）
+        _, th = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return th
+
+    # 軽い順に試す：そのまま→二値化→拡大→拡大＋二値化→適応的二値化
+    attempts = [(lambda: img_gray, "raw")]
+    # 二値化・拡大はQR領域の小さい画像でのみ行う（ページ全体はそのまま→適応的二値化のみ）
+    if upscale:
+        attempts += [
+            (lambda: _otsu(img_gray), "otsu"),
+            (_big, "big"),
+            (lambda: _otsu(_big()), "big_otsu"),
+        ]
+    # 照明ムラに強い局所的な適応的二値化（全画素のヒストグラムを使うOtsuで読めない場合用）
+    attempts.append((
+        lambda: cv2.adaptiveThreshold(
+            img_gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 31, 10
+        ),
+        "adaptive",
+    ))
+
+    for transform, name in attempts:
+        data = _try_decode(detector, transform(), f"{label}_{name}")
         if data:
             return data
 
-    # 2) ページ全体でトライ
-    data = _try_decode(detector, img_bgr, "full_bgr")
-    if data:
-        return data
-
-    # 3) ページ全体をグレースケール＋二値化
-    gray_full = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
-    _, th_full = cv2.threshold(gray_full, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    data = _try_decode(detector, th_full, "full_otsu")
-
-    return data if data else None
+    return None
 
 
 def parse_qr_payload(payload: str) -> Optional[Tuple[str, str, Optional[str]]]:
@@ -207,9 +438,6 @@ def parse_qr_payload(payload: str) -> Optional[Tuple[str, str, Optional[str]]]:
        この形式の場合はNoneを返す（scan_routerでは処理しない）
     戻り値：(teacher, student, text_name) または None
     """
-    import re
-    from urllib.parse import unquote
-    
     p = payload.strip()
     
     # PRINT_ID形式かどうかをチェック
@@ -219,27 +447,23 @@ def parse_qr_payload(payload: str) -> Optional[Tuple[str, str, Optional[str]]]:
         logging.info(f"PRINT_ID形式のQRコードを検出（scan_routerでは処理しません）: {p[:100]}")
         return None
     
-    # 旧形式の処理
-    if "," not in p:
+    # 旧形式の処理（先頭から「,」を探しながら必要な項目だけを切り出す）
+    student, sep, rest = p.partition(",")
+    if not sep:
+        return None
+    teacher, sep, rest = rest.partition(",")
+    student = student.strip()
+    teacher = teacher.strip()
+    if not student or not teacher:
         return None
-
-    parts = [x.strip() for x in p.split(",")]
     
     # 2つの場合（旧形式）：生徒名,講師名
-    if len(parts) == 2:
-        student, teacher = parts
-        if not student or not teacher:
-            return None
+    if not sep:
         return teacher, student, None
     
-    # 3つ以上の場合（新形式）：生徒名,講師名,テキスト名
-    if len(parts) >= 3:
-        student, teacher, text_name = parts[0], parts[1], parts[2]
-        if not student or not teacher:
-            return None
-        return teacher, student, text_name
-    
-    return None
+    # 3つ以上の場合（新形式）：生徒名,講師名,テキスト名（4つ目以降は無視）
+    text_name = rest.split(",", 1)[0].strip()
+    return teacher, student, text_name
 
 
 def build_destination(teacher: str, student: str, text_name: Optional[str] = None) -> Path:
@@ -263,25 +487,45 @@ def build_destination(teacher: str, student: str, text_name: Optional[str] = Non
     else:
         base_name = FNAME_TEMPLATE.format(date=scan_date, student=student_s, suffix=STUDENT_SUFFIX, teacher=teacher_s)
     
-    base_name = sanitize_filename_part(base_name)
-
     dst = teacher_dir / base_name
 
     # 同名があれば連番
     if dst.exists():
-        stem = dst.stem
-        suffix = dst.suffix
-        n = 2
-        while True:
-            candidate = teacher_dir / f"{stem}{DUPLICATE_SUFFIX_TEMPLATE.format(n=n)}{suffix}"
-            if not candidate.exists():
-                dst = candidate
-                break
-            n += 1
+        dst = _next_duplicate_path(teacher_dir, dst.stem, dst.suffix)
 
     return dst
 
 
+def _next_duplicate_path(teacher_dir: Path, stem: str, suffix: str) -> Path:
+    """同名ファイルがある場合の連番付きパスを返す
+    フォルダを1回だけ列挙して既存の連番の最大値+1を使う（候補ごとにexists()を呼ばない）"""
+    pattern = re.compile(
+        re.escape(stem) + re.escape(DUPLICATE_SUFFIX_TEMPLATE).replace(r"\{n\}", r"(\d+)") + re.escape(suffix) + "$"
+    )
+    max_n = 1
+    with os.scandir(teacher_dir) as it:
+        for entry in it:
+            m = pattern.match(entry.name)
+            if m:
+                max_n = max(max_n, int(m.group(1)))
+
+    candidate = teacher_dir / f"{stem}{DUPLICATE_SUFFIX_TEMPLATE.format(n=max_n + 1)}{suffix}"
+    if candidate.exists():
+        # 列挙後に同じ名前が作られた場合（まれ）は、重複しない短いIDを付ける
+        candidate = teacher_dir / f"{stem}_{uuid.uuid4().hex[:6]}{suffix}"
+    return candidate
+
+
+def move_file(src: Path, dst: Path) -> None:
+    """同じドライブ内ならos.renameの1回で移動し、別ドライブの場合のみshutil.moveでコピー移動する"""
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+
+
 def move_to_error(pdf_path: Path, tag: str) -> None:
     """
     QRなし / 読み取れない / 形式不正 などの場合の処理。
@@ -292,6 +536,13 @@ def move_to_error(pdf_path: Path, tag: str) -> None:
 
 def handle_pdf(pdf_path: Path) -> None:
     """PDF1つの処理：安定化待ち→QR読取→リネーム＆移動（=move）"""
+    file_key = str(pdf_path)
+    with processing_files_lock:
+        if file_key in processing_files:
+            logging.info(f"Already processing, skipped: {pdf_path}")
+            return
+        processing_files.add(file_key)
+
     try:
         if pdf_path.suffix.lower() != TARGET_EXT:
             return
@@ -302,8 +553,7 @@ def handle_pdf(pdf_path: Path) -> None:
             logging.warning(f"File not stable or disappeared: {pdf_path}")
             return
 
-        img = render_first_page_to_image(pdf_path, zoom=2.0)
-        qr = decode_qr_from_image(img)
+        qr = read_qr_from_pdf(pdf_path)
 
         if not qr:
             move_to_error(pdf_path, "NOQR")
@@ -323,10 +573,12 @@ def handle_pdf(pdf_path: Path) -> None:
             return
 
         teacher, student, text_name = parsed
-        dst = build_destination(teacher, student, text_name)
+        # 並列処理中に同じ連番を割り当てないよう、移動先の決定と移動をまとめて排他する
+        with _destination_lock:
+            dst = build_destination(teacher, student, text_name)
 
-        # move = 移動しつつファイル名変更（リネーム+移動を一度に）
-        shutil.move(str(pdf_path), str(dst))
+            # move = 移動しつつファイル名変更（リネーム+移動を一度に）
+            move_file(pdf_path, dst)
         if text_name:
             logging.info(f"OK teacher='{teacher}' student='{student}' text='{text_name}' => {dst}")
         else:
@@ -340,6 +592,9 @@ def handle_pdf(pdf_path: Path) -> None:
                 move_to_error(pdf_path, "EXCEPTION")
         except Exception:
             pass
+    finally:
+        with processing_files_lock:
+            processing_files.discard(file_key)
 
 
 # ==========================
@@ -351,21 +606,23 @@ class PDFHandler(FileSystemEventHandler):
             return
         path = Path(event.src_path)
         if path.suffix.lower() == TARGET_EXT:
-            time.sleep(0.3)  # 作成直後の書込中対策
-            handle_pdf(path)
+            # 書込中かどうかはhandle_pdfの安定化待ち（共有なしでのオープン確認）で判定する
+            pdf_executor.submit(handle_pdf, path)
 
     def on_moved(self, event):
         if event.is_directory:
             return
         path = Path(event.dest_path)
         if path.suffix.lower() == TARGET_EXT:
-            time.sleep(0.3)
-            handle_pdf(path)
+            pdf_executor.submit(handle_pdf, path)
 
 
 def main():
     global INBOX_DIR
     
+    if not HAS_PYZBAR:
+        logging.warning("pyzbar not available. Install: pip install pyzbar")
+    
     # ショートカットから実パスを解決
     resolved_inbox = resolve_shortcut(INBOX_SHORTCUT)
     if resolved_inbox is None:
@@ -396,6 +653,8 @@ def main():
         logging.info("Stopping...")
         observer.stop()
     observer.join()
+    # 監視スレッドの停止後にワーカーを止める（停止済みのexecutorへのsubmitを防ぐ）
+    pdf_executor.shutdown(wait=True)
 
 
 if __name__ == "__main__":